@@ -0,0 +1,73 @@
+"""Versioned cache for analytics responses.
+
+Every mutating expense/category route bumps the user's data version, so a
+cached response (and the ETag handed to the browser) is valid for exactly
+as long as the version it was computed at. Versions are counters in the
+main database's ``data_versions`` collection, so every worker agrees on
+them and they survive restarts: an analytics request costs one point read
+by ``_id`` before it is answered from this process's cache or with a 304,
+and a write costs one ``$inc``.
+"""
+import hashlib
+from typing import Awaitable, Callable
+from fastapi import Request, Response
+from .cache import TTLCache
+from .config import settings
+from .serialization import FastJSONResponse
+
+response_cache = TTLCache(maxsize=settings.analytics_cache_size)
+
+
+def _versions():
+    from .database import get_database
+    return get_database().data_versions
+
+
+async def bump_data_version(username: str):
+    """Mark a user's expense data as changed"""
+    await _versions().update_one({"_id": username}, {"$inc": {"v": 1}}, upsert=True)
+
+
+async def data_version(username: str) -> int:
+    doc = await _versions().find_one({"_id": username})
+    return doc["v"] if doc else 0
+
+
+def make_etag(username: str, version: int) -> str:
+    # The username is part of the tag so two users sharing a browser never match
+    user_tag = hashlib.sha1(username.encode()).hexdigest()[:8]
+    return f'W/"{user_tag}-{version}"'
+
+
+def normalized_params(request: Request) -> tuple:
+    return tuple(sorted(
+        (key, value.strip())
+        for key, value in request.query_params.multi_items()
+        if value.strip()
+    ))
+
+
+async def cached_response(
+    request: Request,
+    username: str,
+    endpoint: str,
+    compute: Callable[[], Awaitable]
+) -> Response:
+    """Serve an analytics result from cache, or a 304 if the client is current"""
+    version = await data_version(username)
+    etag = make_etag(username, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    key = (username, endpoint, normalized_params(request), version)
+    content = response_cache.get(key)
+    if content is None:
+        content = await compute()
+        response_cache.set(key, content)
+    return FastJSONResponse(content, headers=headers)
+
+
+def get_analytics_cache_stats() -> dict:
+    return response_cache.stats()
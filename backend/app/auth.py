@@ -1,16 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from pymongo import ReturnDocument
 from .config import settings
-from .models import TokenData, User
+from .models import Principal, TokenData, User
 from .database import get_database
+from .cache import TTLCache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with fewer rounds than configured are flagged for a rehash on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# Authenticated users keyed by (username, token), so a request carrying an
+# already-seen token skips the users lookup entirely. Hits are checked
+# against the revocation table, so a logout on another worker stops a cached
+# token within REVOCATION_REFRESH_SECONDS rather than the cache TTL.
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl_seconds)
+
+
+# bcrypt runs on its own bounded pool so a login burst never blocks the event loop
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash"
+)
+password_hash_stats = {
+    "calls": 0,
+    "in_flight": 0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+    "hash_seconds_total": 0.0,
+    "hash_seconds_max": 0.0,
+    "rehashed": 0,
+}
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -20,6 +53,45 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def _run_password_hashing(func, *args):
+    """Run a bcrypt call on the hashing pool, recording queue wait and hash time"""
+    submitted = time.perf_counter()
+    
+    def timed():
+        started = time.perf_counter()
+        result = func(*args)
+        return result, started, time.perf_counter()
+    
+    password_hash_stats["in_flight"] += 1
+    try:
+        result, started, finished = await asyncio.get_running_loop().run_in_executor(
+            password_hash_executor, timed
+        )
+    finally:
+        password_hash_stats["in_flight"] -= 1
+    
+    queue_wait, hash_time = started - submitted, finished - started
+    password_hash_stats["calls"] += 1
+    password_hash_stats["queue_wait_seconds_total"] += queue_wait
+    password_hash_stats["queue_wait_seconds_max"] = max(password_hash_stats["queue_wait_seconds_max"], queue_wait)
+    password_hash_stats["hash_seconds_total"] += hash_time
+    password_hash_stats["hash_seconds_max"] = max(password_hash_stats["hash_seconds_max"], hash_time)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run_password_hashing(pwd_context.hash, password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password, returning a replacement hash if the stored one is outdated"""
+    return await _run_password_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+def get_password_hash_stats() -> dict:
+    return dict(password_hash_stats)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -31,26 +103,149 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# Lowest token version still accepted per username, refreshed from the users
+# collection every REVOCATION_REFRESH_SECONDS
+revoked_versions: Dict[str, int] = {}
+_revocations_refreshed_at: Optional[datetime] = None
+
+
+def create_user_token(user: User) -> str:
+    """Issue an access token carrying the claims stateless auth needs"""
+    return create_access_token(
+        data={
+            "sub": user.username,
+            "uid": str(user.id),
+            "email": user.email,
+            "ver": user.token_version
+        },
+        expires_delta=timedelta(minutes=settings.access_token_expire_minutes)
     )
+
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
+
+
+def is_token_revoked(payload: dict) -> bool:
+    return payload.get("ver", 0) < revoked_versions.get(payload["sub"], 0)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    payload = decode_token(token)
+    token_data = TokenData(username=payload["sub"])
+    
+    cache_key = (token_data.username, token)
+    cached_user = user_cache.get(cache_key)
+    if cached_user is not None:
+        if is_token_revoked(payload):
+            user_cache.pop(cache_key)
+            raise credentials_exception
+        return cached_user
     
     db = get_database()
     user = await db.users.find_one({"username": token_data.username})
     if user is None:
         raise credentials_exception
-    return User(**user)
+    user = User(**user)
+    if payload.get("ver", 0) < user.token_version:
+        raise credentials_exception
+    
+    # Never keep a user cached past the expiry of the token it was resolved from
+    ttl = settings.user_cache_ttl_seconds
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        user_cache.set(cache_key, user, ttl=ttl)
+    return user
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """Resolve the caller for the data routes.
+    
+    With ``STATELESS_AUTH`` enabled the principal comes straight from the
+    token claims, checked against the in-memory revocation table, so no
+    database read is needed. Otherwise it falls back to the user lookup.
+    """
+    if settings.stateless_auth:
+        payload = decode_token(token)
+        if "uid" in payload:
+            if is_token_revoked(payload):
+                raise credentials_exception
+            return Principal(
+                id=payload["uid"],
+                username=payload["sub"],
+                email=payload.get("email"),
+                token_version=payload.get("ver", 0)
+            )
+    
+    user = await get_current_user(token)
+    return Principal(
+        id=str(user.id),
+        username=user.username,
+        email=user.email,
+        token_version=user.token_version
+    )
+
+
+async def revoke_user_tokens(username: str):
+    """Invalidate every token issued so far, e.g. on logout or password change"""
+    db = get_database()
+    user = await db.users.find_one_and_update(
+        {"username": username},
+        {"$inc": {"token_version": 1}, "$set": {"token_revoked_at": datetime.utcnow()}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        revoked_versions[username] = user["token_version"]
+    invalidate_cached_user(username)
+
+
+async def refresh_revocations():
+    """Pull token versions bumped since the last refresh into memory"""
+    global _revocations_refreshed_at
+    started = datetime.utcnow()
+    query = {"token_revoked_at": {"$exists": True}}
+    if _revocations_refreshed_at:
+        # Overlap the previous window to tolerate clock skew between workers
+        query = {"token_revoked_at": {"$gte": _revocations_refreshed_at - timedelta(minutes=1)}}
+    
+    db = get_database()
+    async for user in db.users.find(query, {"username": 1, "token_version": 1}):
+        revoked_versions[user["username"]] = max(
+            revoked_versions.get(user["username"], 0), user.get("token_version", 0)
+        )
+    _revocations_refreshed_at = started
+
+
+async def run_revocation_refresher():
+    while True:
+        try:
+            await refresh_revocations()
+        except Exception as e:
+            print(f"Failed to refresh token revocations: {e}")
+        await asyncio.sleep(settings.revocation_refresh_seconds)
+
+
+def invalidate_cached_user(username: str):
+    """Drop cached entries for a user after it is changed or deleted"""
+    user_cache.invalidate_where(lambda key: key[0] == username)
+
+
+def get_user_cache_stats() -> dict:
+    return user_cache.stats()
 
 
 async def get_user_by_username(username: str):
@@ -65,6 +260,13 @@ async def authenticate_user(username: str, password: str):
     user = await get_user_by_username(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Transparently upgrade hashes made with fewer rounds than configured
+        db = get_database()
+        await db.users.update_one({"username": username}, {"$set": {"hashed_password": new_hash}})
+        invalidate_cached_user(username)
+        password_hash_stats["rehashed"] += 1
     return user
@@ -1,12 +1,71 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 
 
 class Settings(BaseSettings):
     mongodb_url: str = "mongodb://localhost:27017"
+    mongodb_max_pool_size: int = 100
+    mongodb_min_pool_size: int = 0
+    mongodb_max_idle_time_ms: Optional[int] = None
+    mongodb_wait_queue_timeout_ms: Optional[int] = None
+    mongodb_server_selection_timeout_ms: int = 30000
+    mongodb_compressors: str = ""  # comma-separated, e.g. "zstd,snappy,zlib"
+    user_database_cache_size: int = 1000
+    warmup_connections: int = 10
+    ready_ping_timeout_ms: int = 1000
+    ready_degraded_ms: int = 250
+    storage_mode: Literal["database_per_user", "shared"] = "database_per_user"
+    analytics_read_preference: Literal[
+        "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+    ] = "primary"
+    analytics_max_staleness_seconds: Optional[int] = None
+    analytics_allow_disk_use: bool = True
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    stateless_auth: bool = False
+    revocation_refresh_seconds: int = 30
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    stats_enabled: bool = False
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: int = 60
+    known_names_cache_size: int = 10000
+    known_names_cache_ttl_seconds: int = 300
+    analytics_cache_size: int = 1000
+    bulk_max_rows: int = 50000
+    bulk_insert_chunk_size: int = 1000
+    job_concurrency: int = 2
+    job_batch_size: int = 500
+    job_batch_pause_ms: int = 50
+    job_lease_seconds: int = 60
+    job_poll_seconds: int = 10
+    gzip_minimum_size: int = 1024
+    gzip_compress_level: int = 6
+    rate_limit_enabled: bool = True
+    rate_limit_cache_size: int = 100000
+    # Per route class: sustained requests per second, burst size, requests in flight
+    rate_limit_auth_rate: float = 1.0
+    rate_limit_auth_burst: int = 10
+    rate_limit_auth_concurrency: int = 4
+    rate_limit_write_rate: float = 20.0
+    rate_limit_write_burst: int = 100
+    rate_limit_write_concurrency: int = 8
+    rate_limit_list_rate: float = 20.0
+    rate_limit_list_burst: int = 60
+    rate_limit_list_concurrency: int = 8
+    rate_limit_analytics_rate: float = 5.0
+    rate_limit_analytics_burst: int = 20
+    rate_limit_analytics_concurrency: int = 4
+    
+    @field_validator("analytics_max_staleness_seconds")
+    @classmethod
+    def check_max_staleness(cls, v):
+        # MongoDB rejects anything lower, and only once the first read is sent
+        if v is not None and v < 90:
+            raise ValueError("must be at least 90 seconds")
+        return v
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,130 @@
+"""Where analytics reads go, and how they still see the caller's own writes.
+
+The analytics aggregations can be routed away from the primary with
+``ANALYTICS_READ_PREFERENCE`` (e.g. ``secondaryPreferred``), bounded by
+``ANALYTICS_MAX_STALENESS_SECONDS``. A secondary may not have replicated a
+write the same user made a moment ago, so the expense write routes run in
+a causally consistent session and record its cluster and operation time
+per user; the user's next analytics read starts a causal session advanced
+to that point, and the secondary waits until it has caught up before
+answering. Other reads (``get_expense``, the expense list) stay on the
+primary and always see the latest write.
+
+The times are kept in the main database's ``causal_times`` collection
+rather than in the process, so a read served by another worker still
+waits for the write. That costs a primary round trip per write and per
+analytics read, and only when analytics leave the primary.
+"""
+from contextlib import asynccontextmanager
+from pymongo import read_preferences
+from .config import settings
+
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+_read_preference = None
+
+
+def secondary_reads() -> bool:
+    return settings.analytics_read_preference != "primary"
+
+
+def analytics_read_preference():
+    global _read_preference
+    if _read_preference is None:
+        mode = READ_PREFERENCES[settings.analytics_read_preference]
+        if mode is read_preferences.Primary:
+            _read_preference = mode()
+        else:
+            _read_preference = mode(max_staleness=settings.analytics_max_staleness_seconds or -1)
+    return _read_preference
+
+
+def _client():
+    from .database import client
+    return client
+
+
+def _causal_times():
+    from .database import get_database
+    return get_database().causal_times
+
+
+@asynccontextmanager
+async def write_session(username: str):
+    """Session for a route's writes, so a later analytics read can wait for them.
+
+    Yields ``None`` when analytics read from the primary anyway.
+    """
+    if not secondary_reads():
+        yield None
+        return
+    async with await _client().start_session(causal_consistency=True) as session:
+        yield session
+        if session.operation_time is not None:
+            times = {"operation_time": session.operation_time}
+            if session.cluster_time:
+                times["cluster_time"] = session.cluster_time
+            # $max, so a slower concurrent write can't move the times back;
+            # the cluster time document compares by its timestamp first
+            await _causal_times().update_one({"_id": username}, {"$max": times}, upsert=True)
+
+
+@asynccontextmanager
+async def read_session(username: str):
+    """Causal session that won't read from before the user's last write"""
+    if not secondary_reads():
+        yield None
+        return
+    write_time = await _causal_times().find_one({"_id": username})
+    async with await _client().start_session(causal_consistency=True) as session:
+        if write_time:
+            if write_time.get("cluster_time"):
+                session.advance_cluster_time(write_time["cluster_time"])
+            session.advance_operation_time(write_time["operation_time"])
+        yield session
+
+
+class AnalyticsCollection:
+    """A collection whose aggregations use the analytics read preference and session"""
+
+    def __init__(self, collection, session):
+        if secondary_reads():
+            collection = collection.with_options(read_preference=analytics_read_preference())
+        self.collection = collection
+        self.session = session
+
+    def aggregate(self, pipeline: list, **kwargs):
+        kwargs.setdefault("allowDiskUse", settings.analytics_allow_disk_use)
+        if self.session is not None:
+            kwargs["session"] = self.session
+        return self.collection.aggregate(pipeline, **kwargs)
+
+
+class AnalyticsReader:
+    """Read side of a user store for the analytics routes"""
+
+    def __init__(self, user_db, session):
+        self._db = user_db
+        self._session = session
+        self._collections = {}
+
+    def __getattr__(self, name: str) -> AnalyticsCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = AnalyticsCollection(self._db[name], self._session)
+        return collection
+
+
+@asynccontextmanager
+async def analytics_reader(user_db, username: str):
+    """Yield an ``AnalyticsReader`` for ``user_db`` inside a read session"""
+    async with read_session(username) as session:
+        yield AnalyticsReader(user_db, session)
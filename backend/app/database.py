@@ -1,14 +1,73 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from .cache import TTLCache
 from .config import settings
+from .indexes import ensure_user_indexes
+from .metrics import command_metrics
+from .pool_monitor import pool_stats
+
+MAIN_DB_NAME = "expense_tracker_main"
+USER_DB_PREFIX = "expense_tracker_"
 
 client = None
 main_db = None
 
+# User databases whose indexes have been ensured by this process, and the
+# index tasks still running
+_indexed_databases = set()
+_index_tasks = {}
+
+# Recently used user database handles, each memoizing its collection handles
+_user_databases = TTLCache(maxsize=settings.user_database_cache_size)
+
+
+class CachedDatabase:
+    """Database handle that builds each collection handle only once"""
+
+    def __init__(self, db):
+        self._db = db
+        self._collections = {}
+
+    def __getitem__(self, name: str):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = self._db[name]
+        return collection
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        collection = self._collections.get(name)
+        if collection is not None:
+            return collection
+        attr = getattr(self._db, name)
+        if isinstance(attr, AsyncIOMotorCollection):
+            self._collections[name] = attr
+        return attr
+
+
+def client_options() -> dict:
+    """Connection pool, timeout and compression options for the Motor client"""
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "event_listeners": [pool_stats, command_metrics],
+    }
+    if settings.mongodb_max_idle_time_ms is not None:
+        options["maxIdleTimeMS"] = settings.mongodb_max_idle_time_ms
+    if settings.mongodb_wait_queue_timeout_ms is not None:
+        options["waitQueueTimeoutMS"] = settings.mongodb_wait_queue_timeout_ms
+    compressors = [c.strip() for c in settings.mongodb_compressors.split(",") if c.strip()]
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
 
 async def connect_db():
     global client, main_db
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    main_db = client["expense_tracker_main"]
+    client = AsyncIOMotorClient(settings.mongodb_url, **client_options())
+    main_db = client[MAIN_DB_NAME]
     print("Connected to MongoDB")
 
 
@@ -16,6 +75,7 @@ async def close_db():
     global client
     if client:
         client.close()
+        _user_databases.clear()
         print("Closed MongoDB connection")
 
 
@@ -25,5 +85,41 @@ def get_database():
 
 def get_user_database(username: str):
     """Get or create a separate database for each user"""
-    db_name = f"expense_tracker_{username}"
-    return client[db_name]
+    db_name = f"{USER_DB_PREFIX}{username}"
+    user_db = _user_databases.get(db_name)
+    if user_db is None:
+        user_db = CachedDatabase(client[db_name])
+        _user_databases.set(db_name, user_db)
+    if db_name not in _indexed_databases and db_name not in _index_tasks:
+        _schedule_index_creation(db_name, user_db)
+    return user_db
+
+
+def _schedule_index_creation(db_name: str, user_db):
+    """Ensure indexes in the background the first time a user database is seen"""
+    try:
+        task = asyncio.get_running_loop().create_task(ensure_user_indexes(user_db))
+    except RuntimeError:
+        # No running loop (e.g. a synchronous script); retry on next access
+        return
+    _index_tasks[db_name] = task
+    task.add_done_callback(lambda task: _index_creation_done(db_name, task))
+
+
+def _index_creation_done(db_name: str, task: asyncio.Task):
+    """Mark the database indexed, or leave it to be retried on next access"""
+    _index_tasks.pop(db_name, None)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        print(f"Could not ensure indexes on {db_name}, retrying on next use: {error}")
+        return
+    _indexed_databases.add(db_name)
+
+
+def get_database_stats() -> dict:
+    return {
+        "pool": pool_stats.stats(),
+        "user_database_handles": _user_databases.stats()
+    }
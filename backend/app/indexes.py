@@ -0,0 +1,133 @@
+"""Declarative index registry for the main and per-user databases.
+
+Run ``python -m app.indexes`` to backfill indexes for every existing
+``expense_tracker_*`` database, and for the shared collections when
+``STORAGE_MODE=shared``.
+"""
+import asyncio
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+
+# Indexes for the shared main database
+MAIN_INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("token_revoked_at", ASCENDING)], sparse=True, name="token_revoked_at"),
+    ],
+    "jobs": [
+        # The runner's claim query and the per-user ordering check
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+        # Finished jobs are kept for 30 days
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=30 * 24 * 3600, name="finished_at_ttl"),
+    ],
+}
+
+# Indexes for every per-user database
+USER_INDEXES = {
+    "expenses": [
+        # _id is the keyset pagination tie-breaker for equal dates
+        IndexModel([("date", DESCENDING), ("_id", DESCENDING)], name="date_id"),
+        IndexModel(
+            [("category", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+            name="category_date_id",
+        ),
+        IndexModel(
+            [("category", ASCENDING), ("sub_category", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+            name="category_sub_category_date_id",
+        ),
+        # Subcategory filters without a category
+        IndexModel(
+            [("sub_category", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+            name="sub_category_date_id",
+        ),
+        # Backs /expenses/search; a collection can have only one text index
+        IndexModel(
+            [("title", TEXT), ("comments", TEXT)],
+            weights={"title": 3, "comments": 1},
+            name="title_comments_text",
+        ),
+    ],
+    "rollups": [
+        IndexModel(
+            [("g", ASCENDING), ("b", ASCENDING), ("category", ASCENDING), ("sub_category", ASCENDING)],
+            unique=True,
+            name="bucket_unique",
+        ),
+    ],
+    "categories": [
+        IndexModel([("name", ASCENDING)], unique=True, name="name_unique"),
+    ],
+    "subcategories": [
+        IndexModel([("name", ASCENDING)], unique=True, name="name_unique"),
+    ],
+}
+
+
+def tenant_indexes(registry: dict) -> dict:
+    """Lead every index in ``registry`` with ``user_id`` for the shared collections"""
+    shared = {}
+    for collection_name, indexes in registry.items():
+        shared[collection_name] = []
+        for index in indexes:
+            options = {k: v for k, v in index.document.items() if k not in ("key", "name")}
+            shared[collection_name].append(IndexModel(
+                [("user_id", ASCENDING)] + list(index.document["key"].items()),
+                name=f"user_id_{index.document['name']}",
+                **options
+            ))
+    return shared
+
+
+# Indexes for the shared per-user collections in the main database
+SHARED_INDEXES = tenant_indexes(USER_INDEXES)
+
+
+async def ensure_indexes(db, registry: dict):
+    """Create every index in ``registry`` on ``db``.
+
+    A failure on one collection (e.g. existing duplicates blocking a unique
+    index) is reported and does not stop the remaining collections.
+    """
+    for collection_name, indexes in registry.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            print(f"Could not create indexes on {db.name}.{collection_name}: {e}")
+
+
+async def ensure_main_indexes(db):
+    await ensure_indexes(db, MAIN_INDEXES)
+
+
+async def ensure_user_indexes(db):
+    await ensure_indexes(db, USER_INDEXES)
+
+
+async def ensure_shared_indexes(db):
+    await ensure_indexes(db, SHARED_INDEXES)
+
+
+async def backfill_user_indexes():
+    """Ensure indexes on the main database and every existing user database"""
+    from . import database
+    from .repository import shared_storage
+
+    await database.connect_db()
+    try:
+        await ensure_main_indexes(database.get_database())
+        if shared_storage():
+            await ensure_shared_indexes(database.get_database())
+        for db_name in await database.client.list_database_names():
+            if not db_name.startswith(database.USER_DB_PREFIX) or db_name == database.MAIN_DB_NAME:
+                continue
+            await ensure_user_indexes(database.client[db_name])
+            print(f"Ensured indexes on {db_name}")
+    finally:
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_user_indexes())
@@ -0,0 +1,240 @@
+"""Background jobs persisted in the main database's ``jobs`` collection.
+
+A route submits a job and returns its id straight away; a runner task in
+every API process claims pending jobs and works through them in batches,
+recording progress on the job document as it goes. A claim is a lease
+renewed after every batch, so a job whose process died (or was shut down
+mid-run) is picked up again by any runner once its lease runs out, and
+resumes where it stopped: every batch only touches expenses that still
+need changing.
+
+The jobs here cascade category and subcategory renames and deletes into
+the user's expenses, keeping rollups in step batch by batch. They only
+touch expenses created before the job's ``cutoff`` (when the category
+changed), so one added under a recreated name while the job waits or runs
+keeps it.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from .config import settings
+from .models import Principal
+
+UNCATEGORIZED = "Uncategorized"
+
+# Expense field each job type rewrites
+JOB_FIELDS = {
+    "rename_category": "category",
+    "delete_category": "category",
+    "rename_subcategory": "sub_category",
+    "delete_subcategory": "sub_category",
+}
+
+_running = {}
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _jobs():
+    from .database import get_database
+    return get_database().jobs
+
+
+def _replacement(job: dict) -> Optional[str]:
+    if job["type"] == "delete_category":
+        return UNCATEGORIZED
+    if job["type"] == "delete_subcategory":
+        return None
+    return job["params"]["new"]
+
+
+async def submit_job(user: Principal, job_type: str, params: dict, cutoff: Optional[datetime] = None) -> str:
+    """Persist a job for ``user`` and wake the runner; returns the job id.
+
+    The job only touches expenses created up to ``cutoff`` (default: now).
+    """
+    now = datetime.utcnow()
+    result = await _jobs().insert_one({
+        "type": job_type,
+        "user_id": ObjectId(user.id),
+        "username": user.username,
+        "params": params,
+        "cutoff": cutoff or now,
+        "status": "pending",
+        "progress": {"total": None, "processed": 0},
+        "created_at": now,
+        "updated_at": now,
+    })
+    if _wakeup is not None:
+        _wakeup.set()
+    return str(result.inserted_id)
+
+
+async def claim_job() -> Optional[dict]:
+    """Take the oldest runnable job: pending, or running under an expired lease.
+
+    A user's jobs run one at a time and in order, so a rename that follows
+    another rename of the same name never overtakes it.
+    """
+    jobs = _jobs()
+    now = datetime.utcnow()
+    candidates = jobs.find({"$or": [
+        {"status": "pending"},
+        {"status": "running", "lease_expires_at": {"$lt": now}},
+    ]}).sort("created_at", 1).limit(50)
+    async for candidate in candidates:
+        earlier = await jobs.find_one({
+            "user_id": candidate["user_id"],
+            "status": {"$in": ["pending", "running"]},
+            "created_at": {"$lt": candidate["created_at"]},
+        }, {"_id": 1})
+        if earlier:
+            continue
+        # Only claim it if no other runner got there first
+        job = await jobs.find_one_and_update(
+            {"_id": candidate["_id"], "updated_at": candidate["updated_at"]},
+            {"$set": {
+                "status": "running",
+                "lease_expires_at": now + timedelta(seconds=settings.job_lease_seconds),
+                "started_at": candidate.get("started_at") or now,
+                "updated_at": now,
+            }},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job:
+            return job
+    return None
+
+
+async def _finish(job_id, status: str, **fields):
+    await _jobs().update_one(
+        {"_id": job_id},
+        {"$set": {"status": status, "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow(), **fields},
+         "$unset": {"lease_expires_at": ""}}
+    )
+
+
+async def cascade_rename(job: dict):
+    """Move the user's expenses off the old name in batches"""
+    from .analytics_cache import bump_data_version
+    from .known_names import ensure_names
+    from .repository import get_user_store
+    from .rollups import matching_groups, record_bulk_updated
+
+    field = JOB_FIELDS[job["type"]]
+    old, new = job["params"]["old"], _replacement(job)
+    if old == new:
+        return
+    username = job["username"]
+    user_db = get_user_store(Principal(id=str(job["user_id"]), username=username))
+    if new is not None:
+        await ensure_names(user_db, username, **{
+            "categories" if field == "category" else "subcategories": [new]
+        })
+
+    # Expenses without created_at predate the field, so they count as older
+    cutoff = job.get("cutoff", job["created_at"])
+    selection = {field: old, "created_at": {"$not": {"$gt": cutoff}}}
+    if job["progress"].get("total") is None:
+        total = await user_db.expenses.count_documents(selection)
+        await _jobs().update_one({"_id": job["_id"]}, {"$set": {"progress.total": total}})
+
+    while True:
+        # Renamed expenses drop out of the filter, so each pass takes the next batch
+        batch = await user_db.expenses.find(selection, {"_id": 1}) \
+            .limit(settings.job_batch_size).to_list(length=settings.job_batch_size)
+        if not batch:
+            return
+        query = {**selection, "_id": {"$in": [doc["_id"] for doc in batch]}}
+        groups = await matching_groups(user_db, query)
+        result = await user_db.expenses.update_many(
+            query, {"$set": {field: new, "updated_at": datetime.utcnow()}}
+        )
+        await record_bulk_updated(user_db, groups, {field: new})
+        await bump_data_version(username)
+
+        now = datetime.utcnow()
+        await _jobs().update_one(
+            {"_id": job["_id"]},
+            {"$inc": {"progress.processed": result.modified_count},
+             "$set": {"lease_expires_at": now + timedelta(seconds=settings.job_lease_seconds), "updated_at": now}}
+        )
+        if settings.job_batch_pause_ms:
+            await asyncio.sleep(settings.job_batch_pause_ms / 1000)
+
+
+async def run_job(job: dict):
+    try:
+        await cascade_rename(job)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back so the next runner resumes it
+        await _jobs().update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "pending", "updated_at": datetime.utcnow()}, "$unset": {"lease_expires_at": ""}}
+        )
+        raise
+    except Exception as e:
+        print(f"Job {job['_id']} ({job['type']}) failed: {e}")
+        await _finish(job["_id"], "failed", error=str(e))
+    else:
+        await _finish(job["_id"], "completed")
+
+
+def _job_done(job_id):
+    _running.pop(job_id, None)
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_job_runner():
+    """Claim and run jobs, up to ``JOB_CONCURRENCY`` at a time"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    try:
+        while True:
+            _wakeup.clear()
+            while len(_running) < settings.job_concurrency:
+                try:
+                    job = await claim_job()
+                except Exception as e:
+                    print(f"Failed to claim a job: {e}")
+                    break
+                if job is None:
+                    break
+                task = asyncio.create_task(run_job(job))
+                _running[job["_id"]] = task
+                task.add_done_callback(lambda _, job_id=job["_id"]: _job_done(job_id))
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.job_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _wakeup = None
+        tasks = list(_running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def serialize_job(job: dict) -> dict:
+    return {
+        "id": str(job["_id"]),
+        "type": job["type"],
+        "params": job["params"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+async def get_job(user: Principal, job_id: str) -> Optional[dict]:
+    return await _jobs().find_one({"_id": ObjectId(job_id), "user_id": ObjectId(user.id)})
+
+
+async def list_jobs(user: Principal, limit: int) -> list:
+    cursor = _jobs().find({"user_id": ObjectId(user.id)}).sort("created_at", -1).limit(limit)
+    return await cursor.to_list(length=limit)
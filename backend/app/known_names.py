@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import Iterable, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .cache import TTLCache
+from .config import settings
+
+# Category and subcategory names known to exist, keyed by (username, collection).
+# Sets are warmed lazily from the database and dropped by the category routes;
+# the TTL bounds staleness from writes made by other processes.
+known_names = TTLCache(
+    maxsize=settings.known_names_cache_size,
+    ttl=settings.known_names_cache_ttl_seconds
+)
+
+
+async def upsert_names(collection, names: Iterable[str]):
+    """Create any missing category/subcategory names in one unordered bulk upsert"""
+    names = sorted(names)
+    if not names:
+        return
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne({"name": name}, {"$setOnInsert": {"name": name, "created_at": now}}, upsert=True)
+        for name in names
+    ]
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys only mean a concurrent request created the name first
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+async def _ensure(user_db, username: str, collection_name: str, names: set):
+    key = (username, collection_name)
+    known = known_names.get(key)
+    if known is None:
+        known = set(await user_db[collection_name].distinct("name"))
+        known_names.set(key, known)
+    missing = names - known
+    if missing:
+        await upsert_names(user_db[collection_name], missing)
+        known.update(missing)
+
+
+async def ensure_names(
+    user_db,
+    username: str,
+    categories: Iterable[Optional[str]] = (),
+    subcategories: Iterable[Optional[str]] = ()
+):
+    """Make sure the given category and subcategory names exist for a user.
+
+    Names already known for the user cost no round trip at all.
+    """
+    categories = {name for name in categories if name}
+    subcategories = {name for name in subcategories if name}
+    if categories:
+        await _ensure(user_db, username, "categories", categories)
+    if subcategories:
+        await _ensure(user_db, username, "subcategories", subcategories)
+
+
+def invalidate_names(username: str, collection_name: Optional[str] = None):
+    """Forget known names after a category route changes them"""
+    if collection_name:
+        known_names.pop((username, collection_name))
+    else:
+        known_names.invalidate_where(lambda key: key[0] == username)
+
+
+def get_known_names_stats() -> dict:
+    return known_names.stats()
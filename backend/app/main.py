@@ -1,19 +1,40 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from pathlib import Path
-from .database import connect_db, close_db
-from .routers import auth, expenses, categories, analytics
+from .database import connect_db, close_db, get_database_stats
+from .auth import get_user_cache_stats, get_password_hash_stats, run_revocation_refresher
+from .config import settings
+from .readiness import readiness, warm_up
+from .known_names import get_known_names_stats
+from .analytics_cache import get_analytics_cache_stats
+from .rate_limit import get_rate_limit_stats
+from .jobs import run_job_runner
+from .static import APIGZipMiddleware, IndexPage, PrecompressedStaticFiles
+from .metrics import CONTENT_TYPE, MetricsMiddleware, monitor_event_loop_lag, render_metrics
+from .routers import auth, expenses, categories, analytics, jobs
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_db()
+    # Indexes, pool connections and caches; /ready reports when it's done
+    warmup = asyncio.create_task(warm_up())
+    # Stateless auth and the user cache both check tokens against this table
+    revocation_refresher = asyncio.create_task(run_revocation_refresher())
+    loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    job_runner = asyncio.create_task(run_job_runner())
     yield
     # Shutdown
+    warmup.cancel()
+    loop_lag_monitor.cancel()
+    # Running jobs are handed back before the connection closes
+    job_runner.cancel()
+    await asyncio.gather(job_runner, return_exceptions=True)
+    revocation_refresher.cancel()
     await close_db()
 
 
@@ -31,13 +52,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],
 )
+app.add_middleware(
+    APIGZipMiddleware,
+    minimum_size=settings.gzip_minimum_size,
+    compresslevel=settings.gzip_compress_level,
+)
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(expenses.router, prefix="/api")
 app.include_router(categories.router, prefix="/api")
 app.include_router(analytics.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
 
 
 @app.get("/health")
@@ -45,19 +74,47 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    status_code, body = await readiness()
+    return JSONResponse(body, status_code=status_code)
+
+
+@app.get("/stats", include_in_schema=False)
+async def get_stats():
+    # Process internals for operators; off unless STATS_ENABLED is set
+    if not settings.stats_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {
+        "user_cache": get_user_cache_stats(),
+        "known_names_cache": get_known_names_stats(),
+        "analytics_cache": get_analytics_cache_stats(),
+        "password_hashing": get_password_hash_stats(),
+        "rate_limits": get_rate_limit_stats(),
+        "mongodb": get_database_stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
 # Serve static files from the frontend build
 static_dir = Path(__file__).parent.parent / "frontend" / "dist"
 if static_dir.exists():
-    # Mount static files (JS, CSS, images, etc.)
-    app.mount("/assets", StaticFiles(directory=str(static_dir / "assets")), name="assets")
+    # Hashed JS, CSS and images, served precompressed and cached for good
+    app.mount("/assets", PrecompressedStaticFiles(directory=str(static_dir / "assets")), name="assets")
+    
+    index_file = static_dir / "index.html"
+    index_page = IndexPage(index_file) if index_file.exists() else None
     
     # Catch-all route for client-side routing - must be last
     @app.get("/{full_path:path}")
-    async def serve_frontend(full_path: str):
+    async def serve_frontend(full_path: str, request: Request):
         # Serve index.html for all non-API routes
-        index_file = static_dir / "index.html"
-        if index_file.exists():
-            return FileResponse(index_file)
+        if index_page:
+            return index_page.response(request)
         return {"message": "Frontend not built. Run 'npm run build' in the frontend directory."}
 else:
     @app.get("/")
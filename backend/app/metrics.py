@@ -0,0 +1,210 @@
+"""Prometheus metrics for the API, served as text from ``/metrics``.
+
+Labels are limited to the HTTP method, the route template, the status code
+and the MongoDB command name, so cardinality stays bounded no matter how
+many users or documents there are.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+from pymongo import monitoring
+
+# Starlette appends the charset to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Updated from request handlers and pymongo's threads alike
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        registry.append(self)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            values = {labels: ([*counts], total, count) for labels, (counts, total, count) in self._values.items()}
+        lines = self._header()
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+registry = []
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route")
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled."
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds", "Event loop scheduling delay.", buckets=LOOP_LAG_BUCKETS
+)
+mongodb_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency.", ("command",)
+)
+mongodb_command_errors = Counter(
+    "mongodb_command_errors_total", "Failed MongoDB commands.", ("command",)
+)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def route_label(scope: dict) -> str:
+    """The matched route's path template, never the raw path"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Count and time every HTTP request by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router fills in scope["route"] once a route has matched
+            route = route_label(scope)
+            http_request_duration.observe(time.perf_counter() - start, scope["method"], route)
+            http_requests.inc(scope["method"], route, str(status_code))
+            http_requests_in_progress.dec()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Time MongoDB commands by name from pymongo's command events"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongodb_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongodb_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+        mongodb_command_errors.inc(event.command_name)
+
+
+command_metrics = CommandMetricsListener()
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late the loop wakes this task up, as a proxy for blocking work"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - start - interval))
@@ -0,0 +1,146 @@
+"""Copy the per-user databases into the shared-collection layout.
+
+Run ``python -m app.migrate [--batch-size N] [--final] [username ...]``
+while the API keeps serving from the per-user databases. Documents are
+copied in ``_id`` order and a checkpoint per user and collection is kept in
+the main database's ``migrations`` collection, so an interrupted run
+resumes where it stopped and a rerun only copies documents inserted since.
+Every write is an upsert by ``_id``, so repeating a batch is harmless.
+
+Run once more with ``--final`` right before switching to
+``STORAGE_MODE=shared`` (ideally with writes paused): it also re-copies
+expenses updated since the migration started, re-copies the categories and
+subcategories, and removes documents that were deleted from the source.
+Rollups are not copied; the shared ones are rebuilt on the next analytics
+request.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from . import database
+from .indexes import ensure_shared_indexes
+
+MIGRATION_ID = "shared_storage"
+COLLECTIONS = ("categories", "subcategories", "expenses")
+
+
+async def copy_documents(target, user_id, documents: list) -> int:
+    """Upsert ``documents`` into ``target`` under ``user_id``; returns how many were skipped"""
+    operations = [
+        ReplaceOne({"_id": doc["_id"], "user_id": user_id}, {**doc, "user_id": user_id}, upsert=True)
+        for doc in documents
+    ]
+    try:
+        await target.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate names within one old database can't coexist under the
+        # unique (user_id, name) index; the first copy wins.
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        for error in errors:
+            print(f"Skipped {target.name} {documents[error['index']]['_id']}: {error.get('errmsg')}")
+        return len(errors)
+    return 0
+
+
+async def copy_collection(source, target, user_id, checkpoint_id: str, batch_size: int) -> int:
+    """Copy the documents of ``source`` newer than the checkpoint, in batches"""
+    migrations = database.get_database().migrations
+    checkpoint = await migrations.find_one({"_id": checkpoint_id})
+    if checkpoint is None:
+        checkpoint = {"_id": checkpoint_id, "last_id": None, "copied": 0, "started_at": datetime.utcnow()}
+        await migrations.insert_one(checkpoint)
+
+    last_id = checkpoint["last_id"]
+    copied = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = await source.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        skipped = await copy_documents(target, user_id, batch)
+        last_id = batch[-1]["_id"]
+        copied += len(batch) - skipped
+        await migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}, "$inc": {"copied": len(batch) - skipped}}
+        )
+    return copied
+
+
+async def reconcile_collection(source, target, user_id, checkpoint_id: str, batch_size: int):
+    """Catch up on updates and deletes made to ``source`` during the copy"""
+    checkpoint = await database.get_database().migrations.find_one({"_id": checkpoint_id})
+    if source.name == "expenses":
+        changed = {"updated_at": {"$gte": checkpoint["started_at"]}}
+    else:
+        # Renames don't record a timestamp; these collections are small
+        changed = {}
+
+    batch = []
+    async for doc in source.find(changed).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await copy_documents(target, user_id, batch)
+            batch = []
+    if batch:
+        await copy_documents(target, user_id, batch)
+
+    removed = 0
+    ids = []
+    async for doc in target.find({"user_id": user_id}, {"_id": 1}).batch_size(batch_size):
+        ids.append(doc["_id"])
+        if len(ids) >= batch_size:
+            removed += await _remove_missing(source, target, user_id, ids)
+            ids = []
+    if ids:
+        removed += await _remove_missing(source, target, user_id, ids)
+    if removed:
+        print(f"Removed {removed} deleted documents from {target.name}")
+
+
+async def _remove_missing(source, target, user_id, ids: list) -> int:
+    present = {doc["_id"] for doc in await source.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(length=None)}
+    missing = [_id for _id in ids if _id not in present]
+    if not missing:
+        return 0
+    result = await target.delete_many({"_id": {"$in": missing}, "user_id": user_id})
+    return result.deleted_count
+
+
+async def migrate_user(user: dict, batch_size: int, final: bool = False):
+    main_db = database.get_database()
+    source_db = database.client[f"{database.USER_DB_PREFIX}{user['username']}"]
+    for collection_name in COLLECTIONS:
+        checkpoint_id = f"{MIGRATION_ID}:{user['username']}:{collection_name}"
+        source, target = source_db[collection_name], main_db[collection_name]
+        copied = await copy_collection(source, target, user["_id"], checkpoint_id, batch_size)
+        if final:
+            await reconcile_collection(source, target, user["_id"], checkpoint_id, batch_size)
+        print(f"Copied {copied} {collection_name} for {user['username']}")
+    # The copied expenses bypassed the rollup deltas; rebuild on next read
+    await main_db.rollups.delete_many({"user_id": user["_id"], "g": "meta"})
+
+
+async def migrate(usernames: list, batch_size: int, final: bool = False):
+    await database.connect_db()
+    try:
+        main_db = database.get_database()
+        await ensure_shared_indexes(main_db)
+        query = {"username": {"$in": usernames}} if usernames else {}
+        async for user in main_db.users.find(query, {"username": 1}).sort("_id", 1):
+            await migrate_user(user, batch_size, final)
+    finally:
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("usernames", nargs="*", help="users to migrate (default: all)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--final", action="store_true", help="also sync updates and deletes")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.usernames, args.batch_size, args.final))
@@ -44,6 +44,7 @@ class User(BaseModel):
     username: str
     email: EmailStr
     hashed_password: str
+    token_version: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
@@ -61,6 +62,14 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 
 
+class Principal(BaseModel):
+    """The authenticated caller, as seen by the data routes"""
+    id: Optional[str] = None
+    username: str
+    email: Optional[str] = None
+    token_version: int = 0
+
+
 class Category(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     name: str
@@ -89,7 +98,7 @@ class ExpenseCreate(BaseModel):
     category: str
     sub_category: Optional[str] = None
     amount: float
-    date: Optional[Union[datetime, date_type, str]] = None
+    date: Optional[Union[datetime, date_type, str]] = Field(default=None, validate_default=True)
     comments: Optional[str] = None
     
     @field_validator('date', mode='before')
@@ -142,6 +151,28 @@ class ExpenseUpdate(BaseModel):
         return None
 
 
+class ExpenseFilter(BaseModel):
+    """The filters of ``GET /api/expenses``, for bulk operations"""
+    # A misspelled filter must not silently widen a bulk delete
+    model_config = ConfigDict(extra="forbid")
+    
+    category: Optional[str] = None
+    sub_category: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+
+class ExpenseBulkDelete(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    ids: Optional[List[str]] = None
+    filter: Optional[ExpenseFilter] = None
+
+
+class ExpenseBulkUpdate(ExpenseBulkDelete):
+    update: ExpenseUpdate
+
+
 class Expense(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     title: str
@@ -0,0 +1,80 @@
+import threading
+from pymongo import monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Track connection pool utilization from pymongo's pool events.
+
+    Events arrive on pymongo's own threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.max_checked_out = 0
+        self.max_waiting = 0
+        self.connections_created = 0
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.pool_clears = 0
+
+    def _update(self, **changes):
+        with self._lock:
+            for name, delta in changes.items():
+                setattr(self, name, getattr(self, name) + delta)
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(open_connections=1, connections_created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(open_connections=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        self._update(waiting=-1, checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._update(checked_out=-1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "max_checked_out": self.max_checked_out,
+                "max_waiting": self.max_waiting,
+                "connections_created": self.connections_created,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_clears": self.pool_clears,
+            }
+
+
+pool_stats = PoolStatsListener()
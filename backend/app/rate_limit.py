@@ -0,0 +1,133 @@
+"""Per-user rate limits and in-flight caps for the API routes.
+
+Every route belongs to a class (``auth``, ``write``, ``list`` or
+``analytics``) configured in ``Settings`` with a token bucket (a sustained
+``rate`` per second and a ``burst``) and a ``concurrency`` cap on requests
+in flight at once. Limits are kept per class and per caller: the user for
+authenticated routes, the client address for login and registration. A
+request over either limit gets a 429 with ``Retry-After``, and every
+decision is counted in ``rate_limit_decisions_total`` so the limits can be
+tuned from ``/metrics``.
+
+State is process-local, like the other caches, so with several workers
+each one enforces the limits on its own share of the traffic.
+"""
+import math
+import time
+from typing import Dict, Tuple
+from fastapi import Depends, HTTPException, Request, status
+from .auth import get_current_principal
+from .cache import TTLCache
+from .config import settings
+from .metrics import Counter
+from .models import Principal
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+rate_limit_decisions = Counter(
+    "rate_limit_decisions_total", "Rate limiter decisions.", ("route_class", "decision")
+)
+
+# (route class, caller) -> [tokens, last refill]. A bucket idle long enough
+# to refill completely expires, which is the same as a full bucket.
+_buckets = TTLCache(maxsize=settings.rate_limit_cache_size)
+_in_flight: Dict[Tuple[str, str], int] = {}
+
+
+def limits(route_class: str) -> Tuple[float, int, int]:
+    """The class's (rate per second, burst, concurrency) from the settings"""
+    return (
+        getattr(settings, f"rate_limit_{route_class}_rate"),
+        getattr(settings, f"rate_limit_{route_class}_burst"),
+        getattr(settings, f"rate_limit_{route_class}_concurrency"),
+    )
+
+
+def take_token(route_class: str, caller: str) -> float:
+    """Spend a token; returns 0, or the seconds until one is available"""
+    rate, burst, _ = limits(route_class)
+    key = (route_class, caller)
+    now = time.monotonic()
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = [float(burst), now]
+    else:
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+    wait = 0.0
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+    else:
+        wait = (1 - bucket[0]) / rate
+    _buckets.set(key, bucket, ttl=burst / rate)
+    return wait
+
+
+def _throttle(route_class: str, decision: str, retry_after: float, detail: str):
+    rate_limit_decisions.inc(route_class, decision)
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def acquire(route_class: str, caller: str):
+    """Admit a request or raise a 429; returns the key to ``release`` afterwards"""
+    if not settings.rate_limit_enabled:
+        return None
+    _, _, concurrency = limits(route_class)
+    key = (route_class, caller)
+    # Checked before spending a token, so a rejected request costs nothing
+    if _in_flight.get(key, 0) >= concurrency:
+        _throttle(route_class, "concurrency", 1, "Too many requests in progress")
+    wait = take_token(route_class, caller)
+    if wait:
+        _throttle(route_class, "rate", wait, "Rate limit exceeded")
+    rate_limit_decisions.inc(route_class, "allowed")
+    _in_flight[key] = _in_flight.get(key, 0) + 1
+    return key
+
+
+def release(key):
+    if key is None:
+        return
+    remaining = _in_flight.get(key, 0) - 1
+    if remaining > 0:
+        _in_flight[key] = remaining
+    else:
+        _in_flight.pop(key, None)
+
+
+def rate_limit(read_class: str):
+    """Dependency limiting the current user: reads as ``read_class``, other methods as ``write``"""
+    async def dependency(request: Request, current_user: Principal = Depends(get_current_principal)):
+        route_class = read_class if request.method in READ_METHODS else "write"
+        key = acquire(route_class, current_user.username)
+        try:
+            yield
+        finally:
+            release(key)
+    return dependency
+
+
+async def rate_limit_auth(request: Request):
+    """Dependency limiting login and registration by client address.
+
+    Behind a reverse proxy the address is only the client's if uvicorn
+    trusts the proxy's ``X-Forwarded-For``: run it with ``--proxy-headers``
+    and the proxy's address in ``--forwarded-allow-ips`` (or
+    ``FORWARDED_ALLOW_IPS``), otherwise every client shares the proxy's bucket.
+    """
+    key = acquire("auth", request.client.host if request.client else "unknown")
+    try:
+        yield
+    finally:
+        release(key)
+
+
+def get_rate_limit_stats() -> dict:
+    return {
+        "buckets": _buckets.stats(),
+        "in_flight": sum(_in_flight.values()),
+    }
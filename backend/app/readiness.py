@@ -0,0 +1,90 @@
+"""Startup warmup and the ``/ready`` probe.
+
+``/health`` only says the process is up. ``/ready`` additionally says it
+can serve traffic without making the first requests pay for it: MongoDB has
+been reached, ``WARMUP_CONNECTIONS`` pool connections are open, the core
+indexes exist and, with ``STATELESS_AUTH``, the token revocation table has
+been loaded. Once warm, every probe pings MongoDB within
+``READY_PING_TIMEOUT_MS``, and reports ``degraded`` when the ping takes
+longer than ``READY_DEGRADED_MS``.
+"""
+import asyncio
+import time
+from typing import Tuple
+from .config import settings
+
+# Steps done so far, reported by /ready while starting
+warmup_state = {"mongodb": False, "connections": 0, "indexes": False, "revocations": False, "ready": False}
+
+
+async def open_connections(db, count: int) -> int:
+    """Open ``count`` pool connections by running that many pings at once"""
+    from .pool_monitor import pool_stats
+
+    await asyncio.gather(*(db.command("ping") for _ in range(count)))
+    return pool_stats.open_connections
+
+
+async def warm_up():
+    """Get the process ready for traffic, retrying until MongoDB is reachable"""
+    from .auth import refresh_revocations
+    from .database import get_database
+    from .indexes import ensure_main_indexes, ensure_shared_indexes
+    from .repository import shared_storage
+
+    warmup_state.update(mongodb=False, connections=0, indexes=False, revocations=False, ready=False)
+    delay = 1
+    while True:
+        try:
+            db = get_database()
+            await db.command("ping")
+            warmup_state["mongodb"] = True
+            warmup_state["connections"] = await open_connections(
+                db, min(settings.warmup_connections, settings.mongodb_max_pool_size)
+            )
+
+            await ensure_main_indexes(db)
+            if shared_storage():
+                await ensure_shared_indexes(db)
+            warmup_state["indexes"] = True
+
+            # Otherwise revoked tokens pass until the refresher's first run
+            await refresh_revocations()
+            warmup_state["revocations"] = True
+            break
+        except Exception as e:
+            print(f"Warmup failed, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    warmup_state["ready"] = True
+    print(f"Ready: {warmup_state['connections']} MongoDB connections open")
+
+
+async def ping_mongodb() -> Tuple[bool, float, str]:
+    """Ping within the latency budget; returns (ok, latency in ms, error)"""
+    from .database import get_database
+
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(get_database().command("ping"), timeout=settings.ready_ping_timeout_ms / 1000)
+    except asyncio.TimeoutError:
+        return False, (time.perf_counter() - start) * 1000, "MongoDB ping timed out"
+    except Exception as e:
+        return False, (time.perf_counter() - start) * 1000, str(e)
+    return True, (time.perf_counter() - start) * 1000, ""
+
+
+async def readiness() -> Tuple[int, dict]:
+    """The ``/ready`` status code and body"""
+    if not warmup_state["ready"]:
+        return 503, {"status": "starting", "warmup": dict(warmup_state)}
+
+    ok, latency_ms, error = await ping_mongodb()
+    body = {"status": "ready", "mongodb_latency_ms": round(latency_ms, 2)}
+    if not ok:
+        return 503, {**body, "status": "unavailable", "error": error}
+    if latency_ms > settings.ready_degraded_ms:
+        # Still serving, so stay in rotation; the status is for dashboards and alerts
+        body["status"] = "degraded"
+    return 200, body
@@ -0,0 +1,173 @@
+"""Storage layer the routers go through to reach a user's collections.
+
+With ``STORAGE_MODE=database_per_user`` (the default) every user has an
+``expense_tracker_{username}`` database. With ``STORAGE_MODE=shared`` all
+users live in shared ``expenses``/``categories``/``subcategories``/
+``rollups`` collections of the main database, and every document and index
+is keyed by a leading ``user_id``. Either way the routers get an object
+whose collections behave like plain Motor collections scoped to one user.
+"""
+from typing import Optional
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from . import database
+from .config import settings
+
+TENANT_COLLECTIONS = ("expenses", "categories", "subcategories", "rollups")
+
+
+def shared_storage() -> bool:
+    return settings.storage_mode == "shared"
+
+
+def _hide_user_id(projection):
+    """Keep the tenant key out of documents handed back to the routes"""
+    if projection is None:
+        return {"user_id": 0}
+    if isinstance(projection, dict) and projection and not any(projection.values()):
+        return {**projection, "user_id": 0}
+    return projection
+
+
+class TenantCollection:
+    """A shared collection restricted to one user's documents.
+
+    Filters get the ``user_id`` added, inserted documents are stamped with
+    it, and aggregations start by matching it, so an index led by
+    ``user_id`` serves every query.
+    """
+
+    def __init__(self, collection, user_id: ObjectId):
+        self.collection = collection
+        self.user_id = user_id
+
+    @property
+    def name(self) -> str:
+        return self.collection.name
+
+    def _scope(self, filter: Optional[dict] = None) -> dict:
+        return {**(filter or {}), "user_id": self.user_id}
+
+    def _stamp(self, document: dict) -> dict:
+        document["user_id"] = self.user_id
+        return document
+
+    def find(self, filter: Optional[dict] = None, projection=None, *args, **kwargs):
+        return self.collection.find(self._scope(filter), _hide_user_id(projection), *args, **kwargs)
+
+    async def find_one(self, filter: Optional[dict] = None, projection=None, *args, **kwargs):
+        return await self.collection.find_one(self._scope(filter), _hide_user_id(projection), *args, **kwargs)
+
+    async def find_one_and_update(self, filter: dict, update, projection=None, *args, **kwargs):
+        return await self.collection.find_one_and_update(
+            self._scope(filter), update, _hide_user_id(projection), *args, **kwargs
+        )
+
+    async def find_one_and_delete(self, filter: dict, projection=None, *args, **kwargs):
+        return await self.collection.find_one_and_delete(
+            self._scope(filter), _hide_user_id(projection), *args, **kwargs
+        )
+
+    async def count_documents(self, filter: dict, *args, **kwargs):
+        return await self.collection.count_documents(self._scope(filter), *args, **kwargs)
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, *args, **kwargs):
+        return await self.collection.distinct(key, self._scope(filter), *args, **kwargs)
+
+    async def insert_one(self, document: dict, *args, **kwargs):
+        return await self.collection.insert_one(self._stamp(document), *args, **kwargs)
+
+    async def insert_many(self, documents, *args, **kwargs):
+        return await self.collection.insert_many([self._stamp(d) for d in documents], *args, **kwargs)
+
+    async def update_one(self, filter: dict, update, *args, **kwargs):
+        return await self.collection.update_one(self._scope(filter), update, *args, **kwargs)
+
+    async def update_many(self, filter: dict, update, *args, **kwargs):
+        return await self.collection.update_many(self._scope(filter), update, *args, **kwargs)
+
+    async def replace_one(self, filter: dict, replacement: dict, *args, **kwargs):
+        return await self.collection.replace_one(self._scope(filter), self._stamp(replacement), *args, **kwargs)
+
+    async def delete_one(self, filter: dict, *args, **kwargs):
+        return await self.collection.delete_one(self._scope(filter), *args, **kwargs)
+
+    async def delete_many(self, filter: dict, *args, **kwargs):
+        return await self.collection.delete_many(self._scope(filter), *args, **kwargs)
+
+    def _scope_request(self, request):
+        # pymongo write models keep their arguments in private attributes;
+        # rebuild each one with the tenant key applied.
+        if isinstance(request, InsertOne):
+            return InsertOne(self._stamp(request._doc))
+        if isinstance(request, (UpdateOne, UpdateMany)):
+            return type(request)(
+                self._scope(request._filter), request._doc, upsert=request._upsert,
+                collation=request._collation, array_filters=request._array_filters, hint=request._hint
+            )
+        if isinstance(request, ReplaceOne):
+            return ReplaceOne(
+                self._scope(request._filter), self._stamp(request._doc), upsert=request._upsert,
+                collation=request._collation, hint=request._hint
+            )
+        if isinstance(request, (DeleteOne, DeleteMany)):
+            return type(request)(self._scope(request._filter), collation=request._collation, hint=request._hint)
+        raise TypeError(f"Unsupported bulk write request: {request!r}")
+
+    async def bulk_write(self, requests, *args, **kwargs):
+        return await self.collection.bulk_write([self._scope_request(r) for r in requests], *args, **kwargs)
+
+    def aggregate(self, pipeline: list, *args, **kwargs):
+        pipeline = list(pipeline)
+        if pipeline and "$match" in pipeline[0]:
+            # Fold into the leading $match so stages like $text stay first
+            pipeline[0] = {"$match": self._scope(pipeline[0]["$match"])}
+        else:
+            pipeline.insert(0, {"$match": {"user_id": self.user_id}})
+        return self.collection.aggregate(pipeline, *args, **kwargs)
+
+    def with_options(self, *args, **kwargs):
+        return TenantCollection(self.collection.with_options(*args, **kwargs), self.user_id)
+
+
+class TenantDatabase:
+    """One user's view of the shared collections in the main database"""
+
+    def __init__(self, db, user_id: ObjectId):
+        self._db = db
+        self.user_id = user_id
+        self.name = f"{db.name}[{user_id}]"
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> TenantCollection:
+        if name not in TENANT_COLLECTIONS:
+            raise KeyError(f"{name} is not a per-user collection")
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = TenantCollection(self._db[name], self.user_id)
+        return collection
+
+    def __getattr__(self, name: str) -> TenantCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(str(e))
+
+
+def get_user_store(user):
+    """Return the collections holding ``user``'s data for the configured storage mode.
+
+    ``user`` is anything with ``username`` and ``id``, i.e. a ``Principal``
+    or a ``User``.
+    """
+    if not shared_storage():
+        return database.get_user_database(user.username)
+    user_id = ObjectId(str(user.id))
+    key = ("shared", user_id)
+    store = database._user_databases.get(key)
+    if store is None:
+        store = TenantDatabase(database.get_database(), user_id)
+        database._user_databases.set(key, store)
+    return store
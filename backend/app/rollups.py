@@ -0,0 +1,346 @@
+"""Incrementally maintained daily/monthly expense rollups.
+
+Each user's ``rollups`` collection (see ``app.repository``) has one document per
+(granularity, bucket, category, sub_category) holding the sum, count and
+sum of squares of the expense amounts in that bucket, and how many of
+those expenses have a time of day rather than just a date. The expense routes
+keep it current with ``$inc``; the analytics routes read it once a
+``{"g": "meta", "ready": true}`` marker shows it has been built. While a
+rebuild runs the marker says ``ready: false`` with its ``started_at``, so
+other workers fall back to the expenses instead of starting one of their own.
+Every batch of ``$inc`` deltas also bumps the marker's ``writes`` counter,
+which tells a rebuild whether an expense write raced it.
+
+Run ``python -m app.rollups [username ...]`` to rebuild rollups from the
+expenses (all users when no username is given) and fix any drift.
+"""
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from .cache import TTLCache
+from .config import settings
+
+GRANULARITIES = ("day", "month")
+# Bumped when the rollup documents change shape, so older rollups get rebuilt
+ROLLUP_VERSION = 2
+# How long a worker trusts what it last read from the meta marker
+READY_TTL = 60
+# A rebuild that hasn't finished by then is assumed to have died with its worker
+REBUILD_TIMEOUT = timedelta(minutes=10)
+# How long a rebuild lets writes already made to the expenses reach the rollups
+REBUILD_SETTLE = 5
+# Rebuilds raced by writes this many times in a row are left to a later one
+REBUILD_ATTEMPTS = 3
+
+# Whether each user's rollups are built, keyed by username
+_ready_cache = TTLCache(maxsize=settings.user_cache_size, ttl=READY_TTL)
+_rebuild_tasks = {}
+
+
+def to_utc_naive(dt: datetime) -> datetime:
+    """Normalize to the naive UTC datetimes MongoDB hands back"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def has_time(dt: Optional[datetime]) -> bool:
+    """Whether ``dt`` is more than a date; date-only expenses are stored at UTC midnight"""
+    return dt is not None and to_utc_naive(dt).time() != datetime.min.time()
+
+
+def has_time_expression(field: str) -> dict:
+    """``has_time`` as an aggregation expression on ``field``"""
+    return {"$and": [
+        {"$gt": [field, None]},
+        {"$or": [{"$ne": [{op: field}, 0]} for op in ("$hour", "$minute", "$second", "$millisecond")]}
+    ]}
+
+
+def bucket_start(dt: Optional[datetime], granularity: str) -> Optional[datetime]:
+    if dt is None:
+        # Legacy expenses stored without a date share a null bucket
+        return None
+    dt = to_utc_naive(dt).replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "month":
+        dt = dt.replace(day=1)
+    return dt
+
+
+def floor_day(dt: datetime) -> datetime:
+    return bucket_start(dt, "day")
+
+
+def ceil_day(dt: datetime) -> datetime:
+    day = floor_day(dt)
+    return day if day == to_utc_naive(dt) else day + timedelta(days=1)
+
+
+def _add_deltas(deltas: dict, expense: dict, sign: int):
+    amount = expense.get("amount") or 0
+    for granularity in GRANULARITIES:
+        key = (
+            granularity,
+            bucket_start(expense.get("date"), granularity),
+            expense.get("category"),
+            expense.get("sub_category")
+        )
+        totals = deltas[key]
+        totals[0] += sign * amount
+        totals[1] += sign
+        totals[2] += sign * amount * amount
+        totals[3] += sign * has_time(expense.get("date"))
+
+
+async def _apply_deltas(user_db, deltas: dict, session=None):
+    operations = [
+        UpdateOne(
+            {"g": g, "b": b, "category": category, "sub_category": sub_category},
+            {"$inc": {"sum": total, "count": count, "sumsq": sumsq, "timed": timed}},
+            upsert=True
+        )
+        for (g, b, category, sub_category), (total, count, sumsq, timed) in deltas.items()
+        if count or total or sumsq or timed
+    ]
+    if operations:
+        operations.append(UpdateOne({"g": "meta"}, {"$inc": {"writes": 1}}, upsert=True))
+        await user_db.rollups.bulk_write(operations, ordered=False, session=session)
+
+
+async def record_inserted(user_db, expenses: Iterable[dict], session=None):
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for expense in expenses:
+        _add_deltas(deltas, expense, 1)
+    await _apply_deltas(user_db, deltas, session)
+
+
+async def record_deleted(user_db, expenses: Iterable[dict], session=None):
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for expense in expenses:
+        _add_deltas(deltas, expense, -1)
+    await _apply_deltas(user_db, deltas, session)
+
+
+async def record_updated(user_db, before: dict, after: dict, session=None):
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    _add_deltas(deltas, before, -1)
+    _add_deltas(deltas, after, 1)
+    await _apply_deltas(user_db, deltas, session)
+
+
+async def matching_groups(user_db, query: dict) -> list:
+    """Per-day (category, sub_category) totals of the expenses matching ``query``.
+
+    Read just before a bulk update or delete, so the rollups can be moved
+    by group instead of by document.
+    """
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": {
+                "b": {"$dateFromParts": {
+                    "year": {"$year": "$date"},
+                    "month": {"$month": "$date"},
+                    "day": {"$dayOfMonth": "$date"}
+                }},
+                "category": "$category",
+                "sub_category": "$sub_category"
+            },
+            "sum": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "sumsq": {"$sum": {"$multiply": ["$amount", "$amount"]}},
+            "timed": {"$sum": {"$cond": [has_time_expression("$date"), 1, 0]}}
+        }}
+    ]
+    return await user_db.expenses.aggregate(pipeline).to_list(length=None)
+
+
+def _add_group_deltas(deltas: dict, group: dict, sign: int, changes: Optional[dict] = None):
+    key = {
+        "date": group["_id"].get("b"),
+        "category": group["_id"].get("category"),
+        "sub_category": group["_id"].get("sub_category")
+    }
+    total, count, sumsq, timed = group["sum"], group["count"], group["sumsq"], group["timed"]
+    if changes:
+        key.update({field: changes[field] for field in key if field in changes})
+        if "amount" in changes:
+            # Every expense in the group now has the same amount
+            amount = changes["amount"]
+            total, count, sumsq = amount * count, count, amount * amount * count
+        if "date" in changes:
+            timed = count if has_time(changes["date"]) else 0
+    for granularity in GRANULARITIES:
+        totals = deltas[(granularity, bucket_start(key["date"], granularity), key["category"], key["sub_category"])]
+        totals[0] += sign * total
+        totals[1] += sign * count
+        totals[2] += sign * sumsq
+        totals[3] += sign * timed
+
+
+async def record_bulk_deleted(user_db, groups: list, session=None):
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for group in groups:
+        _add_group_deltas(deltas, group, -1)
+    await _apply_deltas(user_db, deltas, session)
+
+
+async def record_bulk_updated(user_db, groups: list, changes: dict, session=None):
+    """Move each group's totals to where ``changes`` (a ``$set``) puts them"""
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for group in groups:
+        _add_group_deltas(deltas, group, -1)
+        _add_group_deltas(deltas, group, 1, changes)
+    await _apply_deltas(user_db, deltas, session)
+
+
+async def rollups_ready(user_db, username: str) -> bool:
+    """Check whether a user's rollups can be read, scheduling a build if not"""
+    ready = _ready_cache.get(username)
+    if ready is None:
+        meta = await user_db.rollups.find_one({"g": "meta"})
+        ready = bool(meta and meta.get("ready") and meta.get("version") == ROLLUP_VERSION)
+        _ready_cache.set(username, ready)
+        if not ready and not _rebuild_in_progress(meta):
+            schedule_rebuild(user_db, username)
+    return ready
+
+
+def _rebuild_in_progress(meta: Optional[dict]) -> bool:
+    started_at = meta and meta.get("started_at")
+    return bool(started_at) and datetime.utcnow() - started_at < REBUILD_TIMEOUT
+
+
+def schedule_rebuild(user_db, username: str):
+    if username in _rebuild_tasks:
+        return
+    task = asyncio.get_running_loop().create_task(rebuild_rollups(user_db, username))
+    _rebuild_tasks[username] = task
+    task.add_done_callback(lambda _: _rebuild_tasks.pop(username, None))
+
+
+async def mark_rebuilding(user_db, username: Optional[str] = None) -> bool:
+    """Take a user's rollups out of service; returns whether they were in use"""
+    if username:
+        _ready_cache.set(username, False)
+    previous = await user_db.rollups.find_one_and_update(
+        {"g": "meta"},
+        {"$set": {"ready": False, "started_at": datetime.utcnow()}, "$unset": {"built_at": ""}},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    return bool(previous and previous.get("ready"))
+
+
+async def rebuild_rollups(user_db, username: Optional[str] = None, wait: bool = True):
+    """Recompute a user's rollups from scratch out of the expenses collection.
+
+    Analytics fall back to scanning expenses while the rebuild runs. Other
+    workers may have cached the rollups as ready, so unless ``wait`` is off
+    the old rollups are only deleted once those caches have expired.
+
+    An expense write whose deltas land during the rebuild may or may not be
+    in the aggregate, so the rollups are only marked ready if the marker's
+    ``writes`` counter is unchanged once the build has settled; otherwise the
+    build is redone. After ``REBUILD_ATTEMPTS`` raced builds they stay not
+    ready, and the next analytics request schedules another rebuild.
+    """
+    was_ready = await mark_rebuilding(user_db, username)
+    if was_ready and wait:
+        await asyncio.sleep(READY_TTL)
+
+    for attempt in range(REBUILD_ATTEMPTS):
+        meta = await user_db.rollups.find_one({"g": "meta"})
+        writes = meta.get("writes") if meta else None
+        await _build_rollups(user_db)
+        # A write made to the expenses before the aggregate read them may not
+        # have applied its deltas yet; give it time to show up in the counter
+        await asyncio.sleep(REBUILD_SETTLE)
+        result = await user_db.rollups.update_one(
+            {"g": "meta", "writes": writes},
+            {"$set": {"ready": True, "version": ROLLUP_VERSION, "built_at": datetime.utcnow()},
+             "$unset": {"started_at": ""}}
+        )
+        if result.modified_count:
+            if username:
+                _ready_cache.set(username, True)
+            return True
+        print(f"Expenses changed while rebuilding rollups for {username or 'a user'}, retrying")
+
+    # Let the next analytics request start over rather than wait for the timeout
+    await user_db.rollups.update_one({"g": "meta"}, {"$unset": {"started_at": ""}})
+    return False
+
+
+async def _build_rollups(user_db):
+    """Replace the rollup documents with totals aggregated from the expenses"""
+    await user_db.rollups.delete_many({"g": {"$in": list(GRANULARITIES)}})
+
+    for granularity in GRANULARITIES:
+        bucket = {
+            "year": {"$year": "$date"},
+            "month": {"$month": "$date"},
+            "day": {"$dayOfMonth": "$date"} if granularity == "day" else 1
+        }
+        pipeline = [
+            {"$group": {
+                "_id": {
+                    "b": {"$dateFromParts": bucket},
+                    "category": "$category",
+                    "sub_category": "$sub_category"
+                },
+                "sum": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+                "sumsq": {"$sum": {"$multiply": ["$amount", "$amount"]}},
+                "timed": {"$sum": {"$cond": [has_time_expression("$date"), 1, 0]}}
+            }}
+        ]
+        operations = []
+        async for row in user_db.expenses.aggregate(pipeline):
+            key = {
+                "g": granularity,
+                "b": row["_id"]["b"],
+                "category": row["_id"].get("category"),
+                "sub_category": row["_id"].get("sub_category")
+            }
+            values = {"sum": row["sum"], "count": row["count"], "sumsq": row["sumsq"], "timed": row["timed"]}
+            operations.append(ReplaceOne(key, {**key, **values}, upsert=True))
+            if len(operations) >= 1000:
+                await user_db.rollups.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            await user_db.rollups.bulk_write(operations, ordered=False)
+
+
+async def rebuild_all(usernames: Optional[list] = None):
+    from . import database
+    from .models import Principal
+    from .repository import get_user_store
+
+    await database.connect_db()
+    try:
+        query = {"username": {"$in": usernames}} if usernames else {}
+        principals = [
+            Principal(id=str(user["_id"]), username=user["username"])
+            async for user in database.get_database().users.find(query, {"username": 1})
+        ]
+        # Take every user's rollups out of service first, so the wait for
+        # the workers' caches to expire is paid once rather than per user
+        in_use = [await mark_rebuilding(get_user_store(p), p.username) for p in principals]
+        if any(in_use):
+            print(f"Waiting {READY_TTL}s for workers to stop reading the old rollups")
+            await asyncio.sleep(READY_TTL)
+        for principal in principals:
+            if await rebuild_rollups(get_user_store(principal), principal.username, wait=False):
+                print(f"Rebuilt rollups for {principal.username}")
+            else:
+                print(f"Expenses for {principal.username} kept changing; rollups left for a later rebuild")
+    finally:
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_all(sys.argv[1:]))
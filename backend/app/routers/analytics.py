@@ -1,11 +1,25 @@
-from fastapi import APIRouter, Depends, Query
-from typing import Optional, List
-from datetime import datetime
-from ..models import User
-from ..auth import get_current_user
-from ..database import get_user_database
+import re
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from ..models import Principal
+from ..auth import get_current_principal
+from ..repository import get_user_store
+from ..analytics_cache import cached_response
+from ..consistency import analytics_reader
+from ..rollups import ceil_day, floor_day, has_time_expression, rollups_ready, to_utc_naive
+from ..rate_limit import rate_limit
 
-router = APIRouter(prefix="/analytics", tags=["Analytics"])
+router = APIRouter(prefix="/analytics", tags=["Analytics"], dependencies=[Depends(rate_limit("analytics"))])
+
+# Most groups returned by the by-* endpoints
+MAX_GROUPS = 1000
+# Past this many days holding expenses with a time of day, a time zone
+# query scans the expenses rather than listing the days one by one
+MAX_TIMED_DAYS = 100
+
+DATE_ONLY = re.compile(r"\d{4}-\d{2}-\d{2}$")
 
 
 def parse_date_string(date_str: Optional[str]) -> Optional[datetime]:
@@ -21,50 +35,221 @@ def parse_date_string(date_str: Optional[str]) -> Optional[datetime]:
             return None
 
 
-@router.get("/summary")
-async def get_expense_summary(
-    category: Optional[str] = None,
-    sub_category: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
-):
-    user_db = get_user_database(current_user.username)
+def date_condition(start_dt: Optional[datetime], end_dt: Optional[datetime]) -> Optional[dict]:
+    condition = {}
+    if start_dt:
+        condition["$gte"] = start_dt
+    if end_dt:
+        condition["$lte"] = end_dt
+    return condition or None
+
+
+def split_date_range(
+    start_dt: Optional[datetime],
+    end_dt: Optional[datetime]
+) -> Tuple[Optional[dict], List[dict]]:
+    """Split an inclusive date range into whole days and partial-day edges.
     
-    # Build query filter
-    match_stage = {}
-    if category and category.strip():
-        match_stage["category"] = category
-    if sub_category and sub_category.strip():
-        match_stage["sub_category"] = sub_category
+    Returns the ``b`` condition for the day rollups covering every whole day
+    in the range, and the ``date`` conditions for the leftover partial days
+    that have to be read from the expenses themselves.
+    """
+    start_dt = to_utc_naive(start_dt) if start_dt else None
+    end_dt = to_utc_naive(end_dt) if end_dt else None
+    first_day = ceil_day(start_dt) if start_dt else None
+    end_day = floor_day(end_dt) if end_dt else None
     
-    start_dt = parse_date_string(start_date)
-    end_dt = parse_date_string(end_date)
+    if first_day and end_day and first_day >= end_day:
+        return None, [date_condition(start_dt, end_dt)]
+    
+    rollup_range, edges = {}, []
+    if first_day:
+        rollup_range["$gte"] = first_day
+        if start_dt < first_day:
+            edges.append({"$gte": start_dt, "$lt": first_day})
+    if end_day:
+        rollup_range["$lt"] = end_day
+        edges.append({"$gte": end_day, "$lte": end_dt})
+    return rollup_range, edges
+
+
+UTC_ZONES = ("UTC", "Etc/UTC", "GMT", "Etc/GMT")
+
+
+def parse_timezone(tz: str) -> Optional[ZoneInfo]:
+    """Resolve an IANA time zone name; ``None`` stands for UTC"""
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid timezone")
+    return None if zone.key in UTC_ZONES else zone
+
+
+def parse_local_date(date_str: Optional[str], zone: Optional[ZoneInfo]) -> Optional[datetime]:
+    """Parse a date filter, reading a time without an offset as wall-clock time in ``zone``.
     
-    if start_dt or end_dt:
-        match_stage["date"] = {}
-        if start_dt:
-            match_stage["date"]["$gte"] = start_dt
-        if end_dt:
-            match_stage["date"]["$lte"] = end_dt
+    A bare ``yyyy-MM-dd`` is a calendar day, like the expense dates the
+    frontend stores, and stays the same day in every zone.
+    """
+    dt = parse_date_string(date_str)
+    if dt and zone and dt.tzinfo is None and not DATE_ONLY.match(date_str.strip()):
+        return dt.replace(tzinfo=zone)
+    return dt
+
+
+def group_id(
+    group_by: Dict[str, str],
+    date_format: Optional[str],
+    date_field: str,
+    zone: Optional[ZoneInfo] = None
+):
+    group = dict(group_by)
+    if date_format:
+        date_string = {"format": date_format, "date": date_field}
+        if zone:
+            # Date-only expenses (and rollup days) keep their calendar day
+            date_string["timezone"] = {"$cond": [has_time_expression(date_field), zone.key, "UTC"]}
+        group["date"] = {"$dateToString": date_string}
+    return group or None
+
+
+# Field expressions for the two collections analytics can read from
+ROLLUP_FIELDS = {"date": "$b", "amount": "$sum", "count": "$count"}
+EXPENSE_FIELDS = {"date": "$date", "amount": "$amount", "count": 1}
+
+# Define date grouping format (weeks are ISO 8601 weeks, starting Monday)
+DATE_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+    "year": "%Y"
+}
+
+
+def group_stage(
+    fields: dict,
+    group_by: Dict[str, str],
+    date_format: Optional[str] = None,
+    zone: Optional[ZoneInfo] = None
+) -> dict:
+    return {"$group": {
+        "_id": group_id(group_by, date_format, fields["date"], zone),
+        "total_amount": {"$sum": fields["amount"]},
+        "count": {"$sum": fields["count"]}
+    }}
+
+
+async def aggregation_sources(
+    user_db,
+    reader,
+    username: str,
+    start_dt: Optional[datetime],
+    end_dt: Optional[datetime],
+    day_level: bool = True,
+    zone: Optional[ZoneInfo] = None
+) -> List[Tuple[object, dict, dict]]:
+    """Work out which collections answer a date range, and how.
     
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
+    Returns ``(collection, match_stage, fields)`` triples. Whole days come
+    from the rollups once they are built, and only the partial days at the
+    edges of the range are aggregated from the expenses, so the cost no
+    longer grows with the user's history. Rollup days are UTC days; grouping
+    in another ``zone`` only moves expenses that have a time of day, so the
+    days holding any of those are aggregated from the expenses as well. The
+    collections come from ``reader`` (see ``app.consistency``), so they may
+    be read from a secondary.
+    """
+    if await rollups_ready(user_db, username):
+        rollup_range, edges = split_date_range(start_dt, end_dt)
+    else:
+        rollup_range, edges = None, [date_condition(start_dt, end_dt)]
     
-    pipeline.extend([
-        {
-            "$group": {
-                "_id": None,
-                "total_amount": {"$sum": "$amount"},
-                "count": {"$sum": 1},
-                "avg_amount": {"$avg": "$amount"}
-            }
-        }
-    ])
+    if rollup_range is not None and zone:
+        match_stage = {"g": "day", "timed": {"$gt": 0}}
+        if rollup_range:
+            match_stage["b"] = rollup_range
+        rows = await reader.rollups.aggregate([
+            {"$match": match_stage},
+            {"$group": {"_id": "$b"}},
+            {"$limit": MAX_TIMED_DAYS + 1}
+        ]).to_list(length=None)
+        timed_days = sorted(row["_id"] for row in rows)
+        if len(timed_days) > MAX_TIMED_DAYS:
+            rollup_range, edges = None, [date_condition(start_dt, end_dt)]
+        elif timed_days:
+            day_level = True
+            rollup_range = {**rollup_range, "$nin": timed_days}
+            edges = edges + [{"$gte": day, "$lt": day + timedelta(days=1)} for day in timed_days]
     
-    result = await user_db.expenses.aggregate(pipeline).to_list(length=1)
+    sources = []
+    if rollup_range is not None:
+        # Month buckets are enough when no day-level boundary or key is involved
+        match_stage = {"g": "month" if not rollup_range and not day_level else "day"}
+        if rollup_range:
+            match_stage["b"] = rollup_range
+        sources.append((reader.rollups, match_stage, ROLLUP_FIELDS))
     
+    if edges:
+        match_stage = {}
+        conditions = [edge for edge in edges if edge]
+        if len(conditions) == 1:
+            match_stage["date"] = conditions[0]
+        elif conditions:
+            match_stage["$or"] = [{"date": condition} for condition in conditions]
+        sources.append((reader.expenses, match_stage, EXPENSE_FIELDS))
+    return sources
+
+
+def merge_rows(totals: dict, rows: List[dict]):
+    for row in rows:
+        key = tuple(sorted(row["_id"].items())) if row["_id"] else ()
+        entry = totals.setdefault(key, {"total_amount": 0, "count": 0})
+        entry["total_amount"] += row["total_amount"]
+        entry["count"] += row["count"]
+
+
+def finalize_totals(totals: dict) -> List[dict]:
+    return [
+        {**dict(key), **entry, "avg_amount": entry["total_amount"] / entry["count"]}
+        for key, entry in totals.items()
+        if entry["count"] > 0
+    ]
+
+
+async def grouped_totals(
+    user_db,
+    username: str,
+    filters: dict,
+    start_dt: Optional[datetime],
+    end_dt: Optional[datetime],
+    group_by: Dict[str, str],
+    date_format: Optional[str] = None,
+    zone: Optional[ZoneInfo] = None
+) -> List[dict]:
+    """Total and count expenses per group for the given filters"""
+    day_level = date_format not in (None, DATE_FORMATS["month"], DATE_FORMATS["year"])
+    totals = {}
+    async with analytics_reader(user_db, username) as reader:
+        for collection, match_stage, fields in await aggregation_sources(
+            user_db, reader, username, start_dt, end_dt, day_level, zone
+        ):
+            match_stage = {**match_stage, **filters}
+            pipeline = [{"$match": match_stage}] if match_stage else []
+            pipeline.append(group_stage(fields, group_by, date_format, zone))
+            merge_rows(totals, await collection.aggregate(pipeline).to_list(length=None))
+    return finalize_totals(totals)
+
+
+def build_filters(category: Optional[str] = None, sub_category: Optional[str] = None) -> dict:
+    filters = {}
+    if category and category.strip():
+        filters["category"] = category
+    if sub_category and sub_category.strip():
+        filters["sub_category"] = sub_category
+    return filters
+
+
+def summary_response(result: List[dict]) -> dict:
     if not result:
         return {
             "total_amount": 0,
@@ -79,180 +264,327 @@ async def get_expense_summary(
     }
 
 
-@router.get("/by-category")
-async def get_expenses_by_category(
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
-):
-    user_db = get_user_database(current_user.username)
-    
-    match_stage = {}
-    start_dt = parse_date_string(start_date)
-    end_dt = parse_date_string(end_date)
-    
-    if start_dt or end_dt:
-        match_stage["date"] = {}
-        if start_dt:
-            match_stage["date"]["$gte"] = start_dt
-        if end_dt:
-            match_stage["date"]["$lte"] = end_dt
-    
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
-    
-    pipeline.extend([
+def by_category_response(result: List[dict]) -> List[dict]:
+    result.sort(key=lambda item: item["total_amount"], reverse=True)
+    return [
         {
-            "$group": {
-                "_id": "$category",
-                "total_amount": {"$sum": "$amount"},
-                "count": {"$sum": 1},
-                "avg_amount": {"$avg": "$amount"}
-            }
-        },
+            "category": item.get("category"),
+            "total_amount": item["total_amount"],
+            "count": item["count"],
+            "avg_amount": item["avg_amount"]
+        }
+        for item in result[:MAX_GROUPS]
+    ]
+
+
+def by_subcategory_response(result: List[dict]) -> List[dict]:
+    result.sort(key=lambda item: item["total_amount"], reverse=True)
+    return [
         {
-            "$sort": {"total_amount": -1}
+            "category": item.get("category"),
+            "sub_category": item.get("sub_category"),
+            "total_amount": item["total_amount"],
+            "count": item["count"],
+            "avg_amount": item["avg_amount"]
         }
-    ])
-    
-    result = await user_db.expenses.aggregate(pipeline).to_list(length=1000)
-    
+        for item in result[:MAX_GROUPS]
+    ]
+
+
+def by_date_response(result: List[dict]) -> List[dict]:
+    # Legacy expenses without a date form a null group, listed first; past
+    # MAX_GROUPS the most recent buckets are kept
+    result.sort(key=lambda item: item["date"] or "")
     return [
         {
-            "category": item["_id"],
+            "date": item["date"],
             "total_amount": item["total_amount"],
             "count": item["count"],
             "avg_amount": item["avg_amount"]
         }
-        for item in result
+        for item in result[-MAX_GROUPS:]
     ]
 
 
-@router.get("/by-subcategory")
-async def get_expenses_by_subcategory(
+def format_label(day: date, grouping: str) -> str:
+    """The label MongoDB's ``DATE_FORMATS`` give the bucket holding ``day``"""
+    if grouping == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime(DATE_FORMATS[grouping])
+
+
+def bucket_label(dt: datetime, grouping: str, zone: Optional[ZoneInfo]) -> str:
+    if dt.tzinfo is None:
+        # A calendar day (see ``parse_local_date``), or UTC when there is no zone
+        return format_label(dt.date(), grouping)
+    return format_label(dt.astimezone(zone or timezone.utc).date(), grouping)
+
+
+def bucket_start(label: str, grouping: str) -> date:
+    if grouping == "day":
+        return date.fromisoformat(label)
+    if grouping == "week":
+        year, week = label.split("-W")
+        return date.fromisocalendar(int(year), int(week), 1)
+    if grouping == "month":
+        return date.fromisoformat(f"{label}-01")
+    return date(int(label), 1, 1)
+
+
+def previous_bucket(start: date, grouping: str) -> date:
+    if grouping == "day":
+        return start - timedelta(days=1)
+    if grouping == "week":
+        return start - timedelta(weeks=1)
+    if grouping == "month":
+        return date(start.year - (start.month == 1), (start.month - 2) % 12 + 1, 1)
+    return date(start.year - 1, 1, 1)
+
+
+def fill_date_gaps(
+    rows: List[dict],
+    grouping: str,
+    first_label: Optional[str] = None,
+    last_label: Optional[str] = None
+) -> List[dict]:
+    """Insert zero buckets so every bucket from first to last is present.
+    
+    Works back from the last bucket, so a range longer than ``MAX_GROUPS``
+    keeps its most recent buckets. The bounds are widened to every row's
+    bucket, since with ``tz`` a timed expense can fall on a local day just
+    outside the labels of the requested range.
+    """
+    by_label = {row["date"]: row for row in rows if row["date"]}
+    # Labels of one grouping sort chronologically as strings
+    labels = sorted(by_label)
+    if labels:
+        first_label = min(first_label or labels[0], labels[0])
+        last_label = max(last_label or labels[-1], labels[-1])
+    if not first_label or not last_label:
+        return rows
+    
+    undated = [row for row in rows if not row["date"]]
+    filled = []
+    current, first = bucket_start(last_label, grouping), bucket_start(first_label, grouping)
+    while current >= first and len(undated) + len(filled) < MAX_GROUPS:
+        label = format_label(current, grouping)
+        filled.append(by_label.get(label) or {"date": label, "total_amount": 0, "count": 0, "avg_amount": 0})
+        try:
+            current = previous_bucket(current, grouping)
+        except (OverflowError, ValueError):
+            break
+    return undated + filled[::-1]
+
+
+def add_rolling(rows: List[dict], window: int) -> List[dict]:
+    """Add the sum and mean of ``total_amount`` over the last ``window`` buckets"""
+    running = 0
+    for i, row in enumerate(rows):
+        running += row["total_amount"]
+        if i >= window:
+            running -= rows[i - window]["total_amount"]
+        size = min(i + 1, window)
+        row["rolling_total"] = running
+        row["rolling_avg"] = running / size
+    return rows
+
+
+def date_series(
+    result: List[dict],
+    grouping: str,
+    zone: Optional[ZoneInfo],
+    start_dt: Optional[datetime],
+    end_dt: Optional[datetime],
+    fill: bool,
+    rolling: Optional[int]
+) -> List[dict]:
+    """Shape by-date rows for charting: gap-filled and smoothed on request"""
+    rows = by_date_response(result)
+    if fill:
+        rows = fill_date_gaps(
+            rows, grouping,
+            bucket_label(start_dt, grouping, zone) if start_dt else None,
+            bucket_label(end_dt, grouping, zone) if end_dt else None
+        )
+    if rolling:
+        rows = add_rolling(rows, rolling)
+    return rows
+
+
+@router.get("/summary")
+async def get_expense_summary(
+    request: Request,
     category: Optional[str] = None,
+    sub_category: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
-    
-    match_stage = {}
-    if category and category.strip():
-        match_stage["category"] = category
-    
-    start_dt = parse_date_string(start_date)
-    end_dt = parse_date_string(end_date)
-    
-    if start_dt or end_dt:
-        match_stage["date"] = {}
-        if start_dt:
-            match_stage["date"]["$gte"] = start_dt
-        if end_dt:
-            match_stage["date"]["$lte"] = end_dt
+    async def compute():
+        user_db = get_user_store(current_user)
+        
+        result = await grouped_totals(
+            user_db, current_user.username,
+            build_filters(category, sub_category),
+            parse_date_string(start_date), parse_date_string(end_date),
+            group_by={}
+        )
+        return summary_response(result)
     
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
-    
-    pipeline.extend([
-        {
-            "$group": {
-                "_id": {
-                    "category": "$category",
-                    "sub_category": "$sub_category"
-                },
-                "total_amount": {"$sum": "$amount"},
-                "count": {"$sum": 1},
-                "avg_amount": {"$avg": "$amount"}
-            }
-        },
-        {
-            "$sort": {"total_amount": -1}
-        }
-    ])
+    return await cached_response(request, current_user.username, "summary", compute)
+
+
+@router.get("/by-category")
+async def get_expenses_by_category(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal)
+):
+    async def compute():
+        user_db = get_user_store(current_user)
+        
+        result = await grouped_totals(
+            user_db, current_user.username,
+            {},
+            parse_date_string(start_date), parse_date_string(end_date),
+            group_by={"category": "$category"}
+        )
+        return by_category_response(result)
     
-    result = await user_db.expenses.aggregate(pipeline).to_list(length=1000)
+    return await cached_response(request, current_user.username, "by-category", compute)
+
+
+@router.get("/by-subcategory")
+async def get_expenses_by_subcategory(
+    request: Request,
+    category: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal)
+):
+    async def compute():
+        user_db = get_user_store(current_user)
+        
+        result = await grouped_totals(
+            user_db, current_user.username,
+            build_filters(category),
+            parse_date_string(start_date), parse_date_string(end_date),
+            group_by={"category": "$category", "sub_category": "$sub_category"}
+        )
+        return by_subcategory_response(result)
     
-    return [
-        {
-            "category": item["_id"]["category"],
-            "sub_category": item["_id"]["sub_category"],
-            "total_amount": item["total_amount"],
-            "count": item["count"],
-            "avg_amount": item["avg_amount"]
-        }
-        for item in result
-    ]
+    return await cached_response(request, current_user.username, "by-subcategory", compute)
 
 
 @router.get("/by-date")
 async def get_expenses_by_date(
+    request: Request,
     grouping: str = Query("day", regex="^(day|week|month|year)$"),
     category: Optional[str] = None,
     sub_category: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    tz: str = "UTC",
+    fill: bool = False,
+    rolling: Optional[int] = Query(None, ge=2, le=MAX_GROUPS),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    """Totals per day, ISO week, month or year.
     
-    match_stage = {}
-    if category and category.strip():
-        match_stage["category"] = category
-    if sub_category and sub_category.strip():
-        match_stage["sub_category"] = sub_category
+    Buckets follow the wall clock of ``tz`` (an IANA name), which also
+    applies to ``start_date``/``end_date`` given as a time without an
+    offset. Expenses and filters that are just a date are calendar days and
+    land on that day in every zone.
+    ``fill=true`` adds zero buckets for empty periods across the requested
+    range, and ``rolling=N`` adds ``rolling_total``/``rolling_avg`` over
+    the last N buckets.
+    """
+    zone = parse_timezone(tz)
     
-    start_dt = parse_date_string(start_date)
-    end_dt = parse_date_string(end_date)
+    async def compute():
+        user_db = get_user_store(current_user)
+        start_dt = parse_local_date(start_date, zone)
+        end_dt = parse_local_date(end_date, zone)
+        
+        result = await grouped_totals(
+            user_db, current_user.username,
+            build_filters(category, sub_category),
+            start_dt, end_dt,
+            group_by={},
+            date_format=DATE_FORMATS[grouping],
+            zone=zone
+        )
+        return date_series(result, grouping, zone, start_dt, end_dt, fill, rolling)
     
-    if start_dt or end_dt:
-        match_stage["date"] = {}
-        if start_dt:
-            match_stage["date"]["$gte"] = start_dt
-        if end_dt:
-            match_stage["date"]["$lte"] = end_dt
-    
-    # Define date grouping format
-    date_format = {
-        "day": "%Y-%m-%d",
-        "week": "%Y-W%U",
-        "month": "%Y-%m",
-        "year": "%Y"
-    }
+    return await cached_response(request, current_user.username, "by-date", compute)
+
+
+@router.get("/dashboard")
+async def get_dashboard(
+    request: Request,
+    grouping: str = Query("day", regex="^(day|week|month|year)$"),
+    category: Optional[str] = None,
+    sub_category: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    tz: str = "UTC",
+    fill: bool = False,
+    rolling: Optional[int] = Query(None, ge=2, le=MAX_GROUPS),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Summary, by-category, by-subcategory and by-date in one request.
     
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
+    All four result sets come out of a single ``$facet`` aggregation per
+    source collection, sharing the date ``$match``. Each facet applies the
+    same category filters as its standalone endpoint, so the results are
+    identical to calling them one by one. ``tz``, ``fill`` and ``rolling``
+    work as for ``/by-date``.
+    """
+    zone = parse_timezone(tz)
     
-    pipeline.extend([
-        {
-            "$group": {
-                "_id": {
-                    "$dateToString": {
-                        "format": date_format[grouping],
-                        "date": "$date"
-                    }
-                },
-                "total_amount": {"$sum": "$amount"},
-                "count": {"$sum": 1},
-                "avg_amount": {"$avg": "$amount"}
-            }
-        },
-        {
-            "$sort": {"_id": 1}
+    async def compute():
+        user_db = get_user_store(current_user)
+        start_dt = parse_local_date(start_date, zone)
+        end_dt = parse_local_date(end_date, zone)
+        
+        date_format = DATE_FORMATS[grouping]
+        filters = build_filters(category, sub_category)
+        facets = {
+            "summary": (filters, {}, None),
+            "by_category": ({}, {"category": "$category"}, None),
+            "by_subcategory": (build_filters(category), {"category": "$category", "sub_category": "$sub_category"}, None),
+            "by_date": (filters, {}, date_format),
         }
-    ])
-    
-    result = await user_db.expenses.aggregate(pipeline).to_list(length=1000)
-    
-    return [
-        {
-            "date": item["_id"],
-            "total_amount": item["total_amount"],
-            "count": item["count"],
-            "avg_amount": item["avg_amount"]
+        
+        totals = {name: {} for name in facets}
+        async with analytics_reader(user_db, current_user.username) as reader:
+            for collection, match_stage, fields in await aggregation_sources(
+                user_db, reader, current_user.username,
+                start_dt, end_dt,
+                day_level=grouping in ("day", "week"),
+                zone=zone
+            ):
+                facet_stage = {}
+                for name, (facet_filters, group_by, facet_date_format) in facets.items():
+                    stages = [{"$match": facet_filters}] if facet_filters else []
+                    stages.append(group_stage(fields, group_by, facet_date_format, zone))
+                    facet_stage[name] = stages
+                
+                pipeline = [{"$match": match_stage}] if match_stage else []
+                pipeline.append({"$facet": facet_stage})
+                result = await collection.aggregate(pipeline).to_list(length=1)
+                for name in facets:
+                    merge_rows(totals[name], result[0][name])
+        
+        return {
+            "summary": summary_response(finalize_totals(totals["summary"])),
+            "by_category": by_category_response(finalize_totals(totals["by_category"])),
+            "by_subcategory": by_subcategory_response(finalize_totals(totals["by_subcategory"])),
+            "by_date": date_series(
+                finalize_totals(totals["by_date"]), grouping, zone, start_dt, end_dt, fill, rolling
+            )
         }
-        for item in result
-    ]
+    
+    return await cached_response(request, current_user.username, "dashboard", compute)
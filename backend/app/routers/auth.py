@@ -1,20 +1,22 @@
-from datetime import timedelta
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo.errors import DuplicateKeyError
 from ..models import UserCreate, Token, User
 from ..auth import (
-    get_password_hash,
+    hash_password,
     authenticate_user,
-    create_access_token,
-    get_current_user
+    create_user_token,
+    get_current_user,
+    invalidate_cached_user,
+    revoke_user_tokens
 )
-from ..config import settings
 from ..database import get_database
+from ..rate_limit import rate_limit, rate_limit_auth
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
-@router.post("/register", response_model=dict)
+@router.post("/register", response_model=dict, dependencies=[Depends(rate_limit_auth)])
 async def register(user: UserCreate):
     db = get_database()
     
@@ -34,14 +36,22 @@ async def register(user: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     user_dict = {
         "username": user.username,
         "email": user.email,
         "hashed_password": hashed_password
     }
     
-    result = await db.users.insert_one(user_dict)
+    try:
+        result = await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same username/email
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already registered"
+        )
+    invalidate_cached_user(user.username)
     
     return {
         "message": "User created successfully",
@@ -49,7 +59,7 @@ async def register(user: UserCreate):
     }
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(rate_limit_auth)])
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await authenticate_user(form_data.username, form_data.password)
     if not user:
@@ -58,14 +68,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    access_token = create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@router.get("/me", response_model=dict)
+@router.post("/logout", response_model=dict, dependencies=[Depends(rate_limit("list"))])
+async def logout(current_user: User = Depends(get_current_user)):
+    # Revokes every token issued to the user so far, on all devices
+    await revoke_user_tokens(current_user.username)
+    return {"message": "Logged out successfully"}
+
+
+@router.get("/me", response_model=dict, dependencies=[Depends(rate_limit("list"))])
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return {
         "username": current_user.username,
@@ -2,19 +2,26 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from datetime import datetime
 from bson import ObjectId
-from ..models import Category, SubCategory, CategoryCreate, SubCategoryCreate, User
-from ..auth import get_current_user
-from ..database import get_user_database
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from ..models import Category, SubCategory, CategoryCreate, SubCategoryCreate, Principal
+from ..auth import get_current_principal
+from ..repository import get_user_store
+from ..known_names import invalidate_names
+from ..analytics_cache import bump_data_version
+from ..serialization import FastJSONResponse
+from ..jobs import UNCATEGORIZED, submit_job
+from ..rate_limit import rate_limit
 
-router = APIRouter(prefix="/categories", tags=["Categories"])
+router = APIRouter(prefix="/categories", tags=["Categories"], dependencies=[Depends(rate_limit("list"))])
 
 
 @router.post("/", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_category(
     category: CategoryCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     # Check if category already exists
     existing = await user_db.categories.find_one({"name": category.name})
@@ -29,7 +36,16 @@ async def create_category(
         "created_at": datetime.utcnow()
     }
     
-    result = await user_db.categories.insert_one(category_dict)
+    try:
+        result = await user_db.categories.insert_one(category_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Category already exists"
+        )
+    
+    invalidate_names(current_user.username, "categories")
+    await bump_data_version(current_user.username)
     
     return {
         "message": "Category created successfully",
@@ -38,25 +54,22 @@ async def create_category(
 
 
 @router.get("/", response_model=List[dict])
-async def get_categories(current_user: User = Depends(get_current_user)):
-    user_db = get_user_database(current_user.username)
+async def get_categories(current_user: Principal = Depends(get_current_principal)):
+    user_db = get_user_store(current_user)
     
     cursor = user_db.categories.find().sort("name", 1)
     categories = await cursor.to_list(length=1000)
     
-    for category in categories:
-        category["_id"] = str(category["_id"])
-    
-    return categories
+    return FastJSONResponse(categories)
 
 
 @router.put("/{category_id}", response_model=dict)
 async def update_category(
     category_id: str,
     category: CategoryCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(category_id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
@@ -72,23 +85,42 @@ async def update_category(
             detail="Category name already exists"
         )
     
-    result = await user_db.categories.update_one(
-        {"_id": ObjectId(category_id)},
-        {"$set": {"name": category.name}}
-    )
+    # The job leaves alone expenses created after this point
+    cutoff = datetime.utcnow()
+    try:
+        previous = await user_db.categories.find_one_and_update(
+            {"_id": ObjectId(category_id)},
+            {"$set": {"name": category.name}},
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Category name already exists"
+        )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    return {"message": "Category updated successfully"}
+    invalidate_names(current_user.username, "categories")
+    await bump_data_version(current_user.username)
+    
+    # Expenses are renamed in the background; poll /api/jobs/{job_id}
+    job_id = None
+    if previous["name"] != category.name:
+        job_id = await submit_job(
+            current_user, "rename_category", {"old": previous["name"], "new": category.name}, cutoff
+        )
+    
+    return {"message": "Category updated successfully", "job_id": job_id}
 
 
 @router.delete("/{category_id}", response_model=dict)
 async def delete_category(
     category_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(category_id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
@@ -99,21 +131,27 @@ async def delete_category(
         raise HTTPException(status_code=404, detail="Category not found")
     
     # Delete the category
+    cutoff = datetime.utcnow()
     await user_db.categories.delete_one({"_id": ObjectId(category_id)})
     
-    return {
-        "message": "Category deleted successfully",
-        "warning": "Existing expenses with this category will retain the category name"
-    }
+    invalidate_names(current_user.username, "categories")
+    await bump_data_version(current_user.username)
+    
+    # Its expenses move to "Uncategorized" in the background
+    job_id = None
+    if category["name"] != UNCATEGORIZED:
+        job_id = await submit_job(current_user, "delete_category", {"old": category["name"]}, cutoff)
+    
+    return {"message": "Category deleted successfully", "job_id": job_id}
 
 
 # Subcategory endpoints
 @router.post("/subcategories", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_subcategory(
     subcategory: SubCategoryCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     # Check if subcategory already exists
     existing = await user_db.subcategories.find_one({"name": subcategory.name})
@@ -129,7 +167,16 @@ async def create_subcategory(
         "created_at": datetime.utcnow()
     }
     
-    result = await user_db.subcategories.insert_one(subcategory_dict)
+    try:
+        result = await user_db.subcategories.insert_one(subcategory_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Subcategory already exists"
+        )
+    
+    invalidate_names(current_user.username, "subcategories")
+    await bump_data_version(current_user.username)
     
     return {
         "message": "Subcategory created successfully",
@@ -138,25 +185,22 @@ async def create_subcategory(
 
 
 @router.get("/subcategories", response_model=List[dict])
-async def get_subcategories(current_user: User = Depends(get_current_user)):
-    user_db = get_user_database(current_user.username)
+async def get_subcategories(current_user: Principal = Depends(get_current_principal)):
+    user_db = get_user_store(current_user)
     
     cursor = user_db.subcategories.find().sort("name", 1)
     subcategories = await cursor.to_list(length=1000)
     
-    for subcategory in subcategories:
-        subcategory["_id"] = str(subcategory["_id"])
-    
-    return subcategories
+    return FastJSONResponse(subcategories)
 
 
 @router.put("/subcategories/{subcategory_id}", response_model=dict)
 async def update_subcategory(
     subcategory_id: str,
     subcategory: SubCategoryCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(subcategory_id):
         raise HTTPException(status_code=400, detail="Invalid subcategory ID")
@@ -172,36 +216,57 @@ async def update_subcategory(
             detail="Subcategory name already exists"
         )
     
-    result = await user_db.subcategories.update_one(
-        {"_id": ObjectId(subcategory_id)},
-        {"$set": {
-            "name": subcategory.name,
-            "category_id": subcategory.category_id
-        }}
-    )
+    cutoff = datetime.utcnow()
+    try:
+        previous = await user_db.subcategories.find_one_and_update(
+            {"_id": ObjectId(subcategory_id)},
+            {"$set": {
+                "name": subcategory.name,
+                "category_id": subcategory.category_id
+            }},
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Subcategory name already exists"
+        )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Subcategory not found")
     
-    return {"message": "Subcategory updated successfully"}
+    invalidate_names(current_user.username, "subcategories")
+    await bump_data_version(current_user.username)
+    
+    job_id = None
+    if previous["name"] != subcategory.name:
+        job_id = await submit_job(
+            current_user, "rename_subcategory", {"old": previous["name"], "new": subcategory.name}, cutoff
+        )
+    
+    return {"message": "Subcategory updated successfully", "job_id": job_id}
 
 
 @router.delete("/subcategories/{subcategory_id}", response_model=dict)
 async def delete_subcategory(
     subcategory_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(subcategory_id):
         raise HTTPException(status_code=400, detail="Invalid subcategory ID")
     
-    result = await user_db.subcategories.delete_one({"_id": ObjectId(subcategory_id)})
+    cutoff = datetime.utcnow()
+    subcategory = await user_db.subcategories.find_one_and_delete({"_id": ObjectId(subcategory_id)})
     
-    if result.deleted_count == 0:
+    if subcategory is None:
         raise HTTPException(status_code=404, detail="Subcategory not found")
     
-    return {
-        "message": "Subcategory deleted successfully",
-        "warning": "Existing expenses with this subcategory will retain the subcategory name"
-    }
+    invalidate_names(current_user.username, "subcategories")
+    await bump_data_version(current_user.username)
+    
+    # Its expenses lose the subcategory in the background
+    job_id = await submit_job(current_user, "delete_subcategory", {"old": subcategory["name"]}, cutoff)
+    
+    return {"message": "Subcategory deleted successfully", "job_id": job_id}
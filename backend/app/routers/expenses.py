@@ -1,40 +1,132 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
-from typing import List, Optional
+import base64
+import binascii
+import csv
+import io
+import json
+import time
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
 from datetime import datetime
 from bson import ObjectId
-from ..models import Expense, ExpenseCreate, ExpenseUpdate, User
-from ..auth import get_current_user
-from ..database import get_user_database
+from bson.errors import InvalidId
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from ..config import settings
+from ..models import (
+    Expense, ExpenseBulkDelete, ExpenseBulkUpdate, ExpenseCreate, ExpenseUpdate, Principal
+)
+from ..auth import get_current_principal
+from ..repository import get_user_store
+from ..known_names import ensure_names
+from ..rollups import (
+    matching_groups,
+    record_bulk_deleted,
+    record_bulk_updated,
+    record_deleted,
+    record_inserted,
+    record_updated
+)
+from ..analytics_cache import bump_data_version
+from ..consistency import write_session
+from ..serialization import FastJSONResponse
+from ..rate_limit import rate_limit
 
-router = APIRouter(prefix="/expenses", tags=["Expenses"])
+router = APIRouter(prefix="/expenses", tags=["Expenses"], dependencies=[Depends(rate_limit("list"))])
+
+
+def parse_filter_date(date_str: Optional[str]) -> Optional[datetime]:
+    if not date_str or not date_str.strip():
+        return None
+    try:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    except:
+        try:
+            return datetime.strptime(date_str, '%Y-%m-%d')
+        except:
+            return None
+
+
+def build_expense_query(
+    category: Optional[str] = None,
+    sub_category: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> dict:
+    """Build the expenses filter shared by the list and export endpoints"""
+    query = {}
+    if category and category.strip():
+        query["category"] = category
+    if sub_category and sub_category.strip():
+        query["sub_category"] = sub_category
+    
+    start_dt = parse_filter_date(start_date)
+    end_dt = parse_filter_date(end_date)
+    if start_dt or end_dt:
+        query["date"] = {}
+        if start_dt:
+            query["date"]["$gte"] = start_dt
+        if end_dt:
+            query["date"]["$lte"] = end_dt
+    return query
+
+
+def encode_cursor(expense: dict) -> str:
+    """Build an opaque keyset cursor from the last expense of a page"""
+    # Legacy expenses may have no date; the cursor says so with a null
+    last_date = expense.get("date")
+    raw = json.dumps({"d": last_date.isoformat() if last_date else None, "i": str(expense["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        last_date = datetime.fromisoformat(data["d"]) if data["d"] is not None else None
+        return last_date, ObjectId(data["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_search_cursor(expense: dict) -> str:
+    """Build an opaque keyset cursor from the last search result of a page"""
+    raw = json.dumps({"s": expense["score"], "i": str(expense["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return float(data["s"]), ObjectId(data["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.post("/", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_expense(
     expense: ExpenseCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
-    
-    # Auto-create category if it doesn't exist
-    category_exists = await user_db.categories.find_one({"name": expense.category})
-    if not category_exists:
-        await user_db.categories.insert_one({"name": expense.category, "created_at": datetime.utcnow()})
-    
-    # Auto-create subcategory if it doesn't exist and is provided
-    if expense.sub_category:
-        subcategory_exists = await user_db.subcategories.find_one({"name": expense.sub_category})
-        if not subcategory_exists:
-            await user_db.subcategories.insert_one({
-                "name": expense.sub_category,
-                "created_at": datetime.utcnow()
-            })
+    user_db = get_user_store(current_user)
+    
+    # Auto-create category and subcategory if they don't exist
+    await ensure_names(
+        user_db, current_user.username,
+        categories=[expense.category],
+        subcategories=[expense.sub_category]
+    )
     
     expense_dict = expense.model_dump()
     expense_dict["created_at"] = datetime.utcnow()
     expense_dict["updated_at"] = datetime.utcnow()
     
-    result = await user_db.expenses.insert_one(expense_dict)
+    async with write_session(current_user.username) as session:
+        result = await user_db.expenses.insert_one(expense_dict, session=session)
+        await record_inserted(user_db, [expense_dict], session=session)
+    await bump_data_version(current_user.username)
     
     return {
         "message": "Expense created successfully",
@@ -42,6 +134,221 @@ async def create_expense(
     }
 
 
+def _parse_bulk_body(body: bytes, content_type: str) -> Tuple[list, list]:
+    """Split a JSON array or NDJSON request body into rows and per-row parse errors"""
+    rows, errors = [], []
+    if "ndjson" in content_type:
+        for index, line in enumerate(body.splitlines()):
+            if not line.strip():
+                continue
+            try:
+                rows.append((index, json.loads(line)))
+            except ValueError as e:
+                errors.append({"index": index, "error": f"Invalid JSON: {e}"})
+        return rows, errors
+    
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    return list(enumerate(items)), errors
+
+
+@router.post("/bulk", response_model=dict)
+async def create_expenses_bulk(
+    request: Request,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Insert many expenses at once from a JSON array or an NDJSON body.
+
+    Categories and subcategories are upserted once for the whole batch, and
+    expenses go in through unordered ``insert_many`` chunks. Rows that fail
+    validation or insertion are reported individually by their index.
+    """
+    started = time.perf_counter()
+    user_db = get_user_store(current_user)
+    
+    rows, errors = _parse_bulk_body(await request.body(), request.headers.get("content-type", ""))
+    if len(rows) > settings.bulk_max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.bulk_max_rows} expenses per request"
+        )
+    
+    now = datetime.utcnow()
+    documents, indexes = [], []
+    for index, row in rows:
+        try:
+            expense = ExpenseCreate.model_validate(row)
+        except ValidationError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        expense_dict = expense.model_dump()
+        expense_dict["created_at"] = now
+        expense_dict["updated_at"] = now
+        documents.append(expense_dict)
+        indexes.append(index)
+    
+    await ensure_names(
+        user_db, current_user.username,
+        categories=[doc["category"] for doc in documents],
+        subcategories=[doc["sub_category"] for doc in documents]
+    )
+    
+    inserted = 0
+    chunk_size = settings.bulk_insert_chunk_size
+    async with write_session(current_user.username) as session:
+        for offset in range(0, len(documents), chunk_size):
+            chunk = documents[offset:offset + chunk_size]
+            try:
+                result = await user_db.expenses.insert_many(chunk, ordered=False, session=session)
+                inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details["nInserted"]
+                failed = {error["index"] for error in e.details["writeErrors"]}
+                for error in e.details["writeErrors"]:
+                    errors.append({"index": indexes[offset + error["index"]], "error": error["errmsg"]})
+                chunk = [doc for position, doc in enumerate(chunk) if position not in failed]
+            await record_inserted(user_db, chunk, session=session)
+    await bump_data_version(current_user.username)
+    
+    elapsed = time.perf_counter() - started
+    errors.sort(key=lambda error: error["index"])
+    return {
+        "message": f"Inserted {inserted} expenses",
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 4),
+        "rows_per_second": round(inserted / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+# Fields whose changes move an expense between rollup buckets
+BUCKET_FIELDS = ("category", "sub_category", "amount", "date")
+
+
+def bulk_selection_query(selection: ExpenseBulkDelete) -> dict:
+    """Build the filter for a bulk update/delete from its ids or filters"""
+    if (selection.ids is None) == (selection.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either ids or filter")
+    
+    if selection.ids is not None:
+        if len(selection.ids) > settings.bulk_max_rows:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {settings.bulk_max_rows} ids per request"
+            )
+        if not all(ObjectId.is_valid(expense_id) for expense_id in selection.ids):
+            raise HTTPException(status_code=400, detail="Invalid expense ID")
+        return {"_id": {"$in": [ObjectId(expense_id) for expense_id in selection.ids]}}
+    
+    for name in ("start_date", "end_date"):
+        value = getattr(selection.filter, name)
+        # Ignoring it, as the list endpoint does, would widen the selection
+        if value and value.strip() and parse_filter_date(value) is None:
+            raise HTTPException(status_code=400, detail=f"Invalid {name}")
+    
+    query = build_expense_query(**selection.filter.model_dump())
+    if not query:
+        # An empty filter would match every expense the user has
+        raise HTTPException(status_code=400, detail="Filter needs at least one condition")
+    return query
+
+
+async def selection_batches(user_db, query: dict):
+    """Yield the selection in ``_id`` order as ``query`` narrowed to a batch of ids.
+    
+    The rollup groups and the write of a batch then cover the same
+    expenses, even when others start matching ``query`` in between. An
+    expense edited between the two can still leave a small drift, which
+    ``python -m app.rollups`` corrects.
+    """
+    batch_size = settings.bulk_max_rows
+    batch_query = query
+    while True:
+        batch = await user_db.expenses.find(batch_query, {"_id": 1}) \
+            .sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return
+        ids = [doc["_id"] for doc in batch]
+        yield {**query, "_id": {"$in": ids}}
+        if len(ids) < batch_size:
+            return
+        batch_query = {**query, "_id": {**query.get("_id", {}), "$gt": ids[-1]}}
+
+
+@router.patch("/bulk", response_model=dict)
+async def update_expenses_bulk(
+    selection: ExpenseBulkUpdate,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Apply the same changes to many expenses, chosen by ``ids`` or ``filter``.
+
+    The changes go out as one ``update_many`` per batch of ids; new
+    category and subcategory names are created once, and the rollups are
+    moved per day and category group rather than per expense.
+    """
+    user_db = get_user_store(current_user)
+    
+    query = bulk_selection_query(selection)
+    update_dict = {k: v for k, v in selection.update.model_dump().items() if v is not None}
+    if not update_dict:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    await ensure_names(
+        user_db, current_user.username,
+        categories=[update_dict.get("category")],
+        subcategories=[update_dict.get("sub_category")]
+    )
+    
+    moves_rollups = any(field in update_dict for field in BUCKET_FIELDS)
+    update_dict["updated_at"] = datetime.utcnow()
+    matched = modified = 0
+    async with write_session(current_user.username) as session:
+        async for batch_query in selection_batches(user_db, query):
+            groups = await matching_groups(user_db, batch_query) if moves_rollups else []
+            result = await user_db.expenses.update_many(batch_query, {"$set": update_dict}, session=session)
+            if groups:
+                await record_bulk_updated(user_db, groups, update_dict, session=session)
+            matched += result.matched_count
+            modified += result.modified_count
+    await bump_data_version(current_user.username)
+    
+    return {
+        "message": f"Updated {modified} expenses",
+        "matched": matched,
+        "modified": modified
+    }
+
+
+@router.delete("/bulk", response_model=dict)
+async def delete_expenses_bulk(
+    selection: ExpenseBulkDelete,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Delete many expenses, chosen by ``ids`` or ``filter``, with one ``delete_many`` per batch of ids"""
+    user_db = get_user_store(current_user)
+    
+    query = bulk_selection_query(selection)
+    deleted = 0
+    async with write_session(current_user.username) as session:
+        async for batch_query in selection_batches(user_db, query):
+            groups = await matching_groups(user_db, batch_query)
+            result = await user_db.expenses.delete_many(batch_query, session=session)
+            await record_bulk_deleted(user_db, groups, session=session)
+            deleted += result.deleted_count
+    await bump_data_version(current_user.username)
+    
+    return {
+        "message": f"Deleted {deleted} expenses",
+        "matched": deleted,
+        "deleted": deleted
+    }
+
+
 @router.get("/", response_model=List[dict])
 async def get_expenses(
     category: Optional[str] = None,
@@ -50,51 +357,173 @@ async def get_expenses(
     end_date: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
-    # Build query filter
-    query = {}
-    if category and category.strip():
-        query["category"] = category
-    if sub_category and sub_category.strip():
-        query["sub_category"] = sub_category
-    if start_date or end_date:
-        query["date"] = {}
-        if start_date and start_date.strip():
-            try:
-                query["date"]["$gte"] = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            except:
-                try:
-                    query["date"]["$gte"] = datetime.strptime(start_date, '%Y-%m-%d')
-                except:
-                    pass
-        if end_date and end_date.strip():
-            try:
-                query["date"]["$lte"] = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            except:
-                try:
-                    query["date"]["$lte"] = datetime.strptime(end_date, '%Y-%m-%d')
-                except:
-                    pass
+    query = build_expense_query(category, sub_category, start_date, end_date)
+    
+    # Keyset pagination: continue strictly after the (date, _id) of the last
+    # row. Expenses without a date sort after every dated one, by _id alone.
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        if last_date is None:
+            after_cursor = {"date": None, "_id": {"$lt": last_id}}
+        else:
+            after_cursor = {"$or": [
+                {"date": {"$lt": last_date}},
+                {"date": last_date, "_id": {"$lt": last_id}},
+                {"date": None}
+            ]}
+        query = {"$and": [query, after_cursor]} if query else after_cursor
+    
+    db_cursor = user_db.expenses.find(query).sort([("date", -1), ("_id", -1)]).skip(skip).limit(limit)
+    expenses = await db_cursor.to_list(length=limit)
+    
+    # A full page means there may be more rows after it
+    headers = {}
+    if len(expenses) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(expenses[-1])
+    
+    # ObjectIds and datetimes are encoded by orjson, no per-row conversion
+    return FastJSONResponse(expenses, headers=headers)
+
+
+EXPORT_FIELDS = [
+    "_id", "title", "category", "sub_category", "amount",
+    "date", "comments", "created_at", "updated_at"
+]
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+async def _stream_csv(db_cursor, batch_size: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    async for expense in db_cursor:
+        writer.writerow(["" if expense.get(f) is None else _export_value(expense[f]) for f in EXPORT_FIELDS])
+        rows += 1
+        if rows % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def _stream_ndjson(db_cursor, batch_size: int):
+    lines = []
+    async for expense in db_cursor:
+        lines.append(json.dumps({f: _export_value(expense.get(f)) for f in EXPORT_FIELDS}))
+        if len(lines) == batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def _close_after(chunks, db_cursor):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await db_cursor.close()
+
+
+@router.get("/export")
+async def export_expenses(
+    format: str = Query("csv", regex="^(csv|ndjson)$"),
+    category: Optional[str] = None,
+    sub_category: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    batch_size: int = Query(500, ge=1, le=10000),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Stream every matching expense as CSV or NDJSON.
+
+    Rows are written as they come off the Motor cursor, one chunk per
+    ``batch_size`` rows, so memory use does not grow with the export size.
+    """
+    user_db = get_user_store(current_user)
+    
+    query = build_expense_query(category, sub_category, start_date, end_date)
+    db_cursor = user_db.expenses.find(query).sort([("date", -1), ("_id", -1)]).batch_size(batch_size)
+    
+    if format == "csv":
+        chunks, media_type = _stream_csv(db_cursor, batch_size), "text/csv"
+    else:
+        chunks, media_type = _stream_ndjson(db_cursor, batch_size), "application/x-ndjson"
+    
+    return StreamingResponse(
+        _close_after(chunks, db_cursor),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="expenses.{format}"'}
+    )
+
+
+@router.get("/search", response_model=List[dict])
+async def search_expenses(
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    sub_category: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Full-text search over expense titles and comments.
+
+    Uses the text index on ``title``/``comments`` (titles weigh more), so
+    words are matched by stem, a quoted phrase must appear as is and a
+    leading ``-`` excludes a word. Results are ranked by relevance, then
+    newest first; pass the ``X-Next-Cursor`` header back as ``cursor`` for
+    the next page.
+    """
+    user_db = get_user_store(current_user)
     
-    cursor = user_db.expenses.find(query).sort("date", -1).skip(skip).limit(limit)
-    expenses = await cursor.to_list(length=limit)
+    query = build_expense_query(category, sub_category, start_date, end_date)
+    query["$text"] = {"$search": q}
     
-    # Convert ObjectId to string
-    for expense in expenses:
-        expense["_id"] = str(expense["_id"])
+    pipeline = [
+        {"$match": query},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if cursor:
+        last_score, last_id = decode_search_cursor(cursor)
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": last_score}},
+            {"score": last_score, "_id": {"$lt": last_id}}
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": limit},
+        {"$project": {**{field: 1 for field in EXPORT_FIELDS}, "score": 1}},
+    ]
+    expenses = await user_db.expenses.aggregate(pipeline).to_list(length=limit)
     
-    return expenses
+    headers = {}
+    if len(expenses) == limit:
+        headers["X-Next-Cursor"] = encode_search_cursor(expenses[-1])
+    
+    return FastJSONResponse(expenses, headers=headers)
 
 
 @router.get("/{expense_id}", response_model=dict)
 async def get_expense(
     expense_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=400, detail="Invalid expense ID")
@@ -103,53 +532,48 @@ async def get_expense(
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
-    expense["_id"] = str(expense["_id"])
-    return expense
+    return FastJSONResponse(expense)
 
 
 @router.put("/{expense_id}", response_model=dict)
 async def update_expense(
     expense_id: str,
     expense_update: ExpenseUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=400, detail="Invalid expense ID")
     
-    # Check if expense exists
-    existing_expense = await user_db.expenses.find_one({"_id": ObjectId(expense_id)})
-    if not existing_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
     # Build update dict
     update_dict = {k: v for k, v in expense_update.model_dump().items() if v is not None}
     
     if not update_dict:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    # Auto-create category if changed and doesn't exist
-    if "category" in update_dict:
-        category_exists = await user_db.categories.find_one({"name": update_dict["category"]})
-        if not category_exists:
-            await user_db.categories.insert_one({"name": update_dict["category"], "created_at": datetime.utcnow()})
-    
-    # Auto-create subcategory if changed and doesn't exist
-    if "sub_category" in update_dict and update_dict["sub_category"]:
-        subcategory_exists = await user_db.subcategories.find_one({"name": update_dict["sub_category"]})
-        if not subcategory_exists:
-            await user_db.subcategories.insert_one({
-                "name": update_dict["sub_category"],
-                "created_at": datetime.utcnow()
-            })
-    
     update_dict["updated_at"] = datetime.utcnow()
     
-    await user_db.expenses.update_one(
-        {"_id": ObjectId(expense_id)},
-        {"$set": update_dict}
-    )
+    async with write_session(current_user.username) as session:
+        # The previous version of the document is needed to move its rollup totals
+        existing_expense = await user_db.expenses.find_one_and_update(
+            {"_id": ObjectId(expense_id)},
+            {"$set": update_dict},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if not existing_expense:
+            raise HTTPException(status_code=404, detail="Expense not found")
+        
+        # Auto-create category and subcategory if changed and don't exist
+        await ensure_names(
+            user_db, current_user.username,
+            categories=[update_dict.get("category")],
+            subcategories=[update_dict.get("sub_category")]
+        )
+        
+        await record_updated(user_db, existing_expense, {**existing_expense, **update_dict}, session=session)
+    await bump_data_version(current_user.username)
     
     return {"message": "Expense updated successfully"}
 
@@ -157,16 +581,20 @@ async def update_expense(
 @router.delete("/{expense_id}", response_model=dict)
 async def delete_expense(
     expense_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    user_db = get_user_database(current_user.username)
+    user_db = get_user_store(current_user)
     
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=400, detail="Invalid expense ID")
     
-    result = await user_db.expenses.delete_one({"_id": ObjectId(expense_id)})
-    
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Expense not found")
+    async with write_session(current_user.username) as session:
+        expense = await user_db.expenses.find_one_and_delete({"_id": ObjectId(expense_id)}, session=session)
+        
+        if not expense:
+            raise HTTPException(status_code=404, detail="Expense not found")
+        
+        await record_deleted(user_db, [expense], session=session)
+    await bump_data_version(current_user.username)
     
     return {"message": "Expense deleted successfully"}
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List
+from bson import ObjectId
+from ..models import Principal
+from ..auth import get_current_principal
+from ..jobs import get_job, list_jobs, serialize_job
+from ..serialization import FastJSONResponse
+from ..rate_limit import rate_limit
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"], dependencies=[Depends(rate_limit("list"))])
+
+
+@router.get("/", response_model=List[dict])
+async def get_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Principal = Depends(get_current_principal)
+):
+    jobs = await list_jobs(current_user, limit)
+    
+    return FastJSONResponse([serialize_job(job) for job in jobs])
+
+
+@router.get("/{job_id}", response_model=dict)
+async def get_job_status(
+    job_id: str,
+    current_user: Principal = Depends(get_current_principal)
+):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    job = await get_job(current_user, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return FastJSONResponse(serialize_job(job))
@@ -0,0 +1,27 @@
+"""orjson-backed responses for routes that return raw MongoDB documents.
+
+``FastJSONResponse`` encodes ``ObjectId`` and ``datetime`` values directly,
+so a route can return the documents it read without a Python pass over
+every row and without FastAPI's ``jsonable_encoder``/``response_model``
+round trip.
+"""
+from typing import Any
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    # orjson encodes datetimes natively, in the same ISO format as before
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
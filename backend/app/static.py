@@ -0,0 +1,137 @@
+"""Serving the built frontend and compressing API responses.
+
+Vite names every file under ``dist/assets`` after a hash of its content, so
+those can be cached by browsers forever; ``npm run build`` also writes
+``.br`` and ``.gz`` variants next to them, which are sent as-is to clients
+that accept them. ``index.html`` is the one file that changes in place: it
+is read once at startup, kept in memory with an ETag, and revalidated by
+the browser on every load, so a repeat visit costs a 304 and nothing else.
+"""
+import gzip
+import hashlib
+import mimetypes
+import stat
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import RedirectResponse
+from starlette.staticfiles import NotModifiedResponse
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def accepted_encodings(headers: Headers) -> set:
+    """Content codings the client accepts, ignoring any it refuses with ``q=0``"""
+    accepted = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """``StaticFiles`` for hashed assets: precompressed variants and immutable caching"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The build output doesn't change while we run, so found files are remembered
+        self._found: Dict[str, Tuple[str, object]] = {}
+
+    def lookup_path(self, path: str):
+        found = self._found.get(path)
+        if found is None:
+            full_path, stat_result = super().lookup_path(path)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                return full_path, stat_result
+            found = self._found[path] = (full_path, stat_result)
+        return found
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await self._precompressed_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304) and not isinstance(response, RedirectResponse):
+            response.headers["Cache-Control"] = IMMUTABLE
+            response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+    async def _precompressed_response(self, path: str, scope) -> Optional[Response]:
+        if scope["method"] not in ("GET", "HEAD"):
+            return None
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            response = FileResponse(
+                full_path,
+                stat_result=stat_result,
+                method=scope["method"],
+                media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                headers={"Content-Encoding": encoding},
+            )
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
+
+
+class IndexPage:
+    """``index.html`` held in memory, with its compressed variants and an ETag"""
+
+    def __init__(self, path: Path):
+        self.body = path.read_bytes()
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            compressed = path.with_name(path.name + suffix)
+            if compressed.exists():
+                self.variants[encoding] = compressed.read_bytes()
+        if "gzip" not in self.variants:
+            self.variants["gzip"] = gzip.compress(self.body)
+
+    def response(self, request: Request) -> Response:
+        # Always revalidated, so a new deploy shows up on the next load
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        accepted = accepted_encodings(request.headers)
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                headers["Content-Encoding"] = encoding
+                return Response(self.variants[encoding], media_type="text/html", headers=headers)
+        return Response(self.body, media_type="text/html", headers=headers)
+
+
+class APIGZipMiddleware:
+    """Gzip large responses under ``prefix``; everything else passes straight through.
+
+    The frontend files arrive precompressed, and compressing them again on
+    every request would only cost CPU.
+    """
+
+    def __init__(self, app, prefix: str = "/api", minimum_size: int = 1024, compresslevel: int = 6):
+        self.app = app
+        self.prefix = prefix
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.prefix):
+            await self.gzip(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
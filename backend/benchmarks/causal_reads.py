@@ -0,0 +1,70 @@
+"""Read-your-writes check for analytics routed to secondaries.
+
+Registers a throwaway user, then repeatedly creates an expense and
+immediately reads the analytics summary and dashboard, failing if either
+misses the expense just written. Run it with the analytics read preference
+you deploy, against a replica set::
+
+    ANALYTICS_READ_PREFERENCE=secondaryPreferred ANALYTICS_MAX_STALENESS_SECONDS=90 \\
+        python -m benchmarks.causal_reads --writes 200
+
+A single-host replica set is enough to exercise the sessions; see
+"Analytics reads on secondaries" in the README. Exits non-zero on any
+stale read.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import httpx  # noqa: E402
+
+
+async def run(args) -> int:
+    from app.config import settings
+    from app.main import app
+
+    settings.rate_limit_enabled = False
+    stale = 0
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://causal-reads") as client:
+            username = f"causal_{uuid.uuid4().hex[:8]}"
+            password = uuid.uuid4().hex
+            response = await client.post("/api/auth/register", json={
+                "username": username, "email": f"{username}@example.com", "password": password
+            })
+            response.raise_for_status()
+            response = await client.post("/api/auth/login", data={"username": username, "password": password})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            print(f"read preference {settings.analytics_read_preference}, user {username}")
+            for n in range(1, args.writes + 1):
+                response = await client.post("/api/expenses/", headers=headers, json={
+                    "title": "Causal read check", "category": "Check", "amount": 1
+                })
+                response.raise_for_status()
+                # A unique throwaway parameter keeps the response cache out of the way
+                summary = (await client.get("/api/analytics/summary", headers=headers, params={"n": n})).json()
+                dashboard = (await client.get("/api/analytics/dashboard", headers=headers, params={"n": n})).json()
+                for name, count in (("summary", summary["count"]), ("dashboard", dashboard["summary"]["count"])):
+                    if count != n:
+                        stale += 1
+                        print(f"STALE {name} after write {n}: saw {count} expenses")
+    print(f"{args.writes} writes, {stale} stale reads")
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check analytics reads see the caller's own writes")
+    parser.add_argument("--writes", type=int, default=100)
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(run(args)) else 0)
+
+
+if __name__ == "__main__":
+    main()
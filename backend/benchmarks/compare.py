@@ -0,0 +1,42 @@
+"""Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json
+
+Prints each scenario's p50/p95/p99 and throughput side by side with the
+relative change; positive latency changes are slowdowns.
+"""
+import argparse
+import json
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["scenarios"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["scenarios"]
+
+    for name in baseline:
+        if name not in candidate:
+            print(f"{name:<30} missing from {args.candidate}")
+            continue
+        before, after = baseline[name], candidate[name]
+        columns = [
+            f"{metric} {before[metric]:.2f} -> {after[metric]:.2f} ({change(before[metric], after[metric])})"
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+        ]
+        print(f"{name:<30} " + "  ".join(columns))
+
+
+if __name__ == "__main__":
+    main()
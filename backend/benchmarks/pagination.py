@@ -0,0 +1,103 @@
+"""Keyset pagination check for ``GET /api/expenses``.
+
+Registers a throwaway user, creates dated expenses (several sharing a
+date) through the API, then adds legacy expenses with a null or missing
+date straight into the user's database. Every page size from 1 up to
+``--max-limit`` is then walked through ``X-Next-Cursor``, failing if any
+expense is skipped, repeated or out of order compared with the unpaged
+list. Run it from the backend directory::
+
+    python -m benchmarks.pagination --in-memory
+    python -m benchmarks.pagination --expenses 50 --legacy 7
+
+Exits non-zero on any mismatch.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import httpx  # noqa: E402
+from . import seed as seeding  # noqa: E402
+
+
+async def walk(client, headers, limit: int) -> list:
+    """Collect the ids of every page of ``limit`` rows, following the cursor"""
+    seen = []
+    params = {"limit": limit}
+    while True:
+        response = await client.get("/api/expenses/", headers=headers, params=params)
+        response.raise_for_status()
+        seen.extend(expense["_id"] for expense in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return seen
+        params = {"limit": limit, "cursor": cursor}
+
+
+async def run(args) -> int:
+    from app.config import settings
+    from app.database import get_user_database
+    from app.main import app
+
+    settings.rate_limit_enabled = False
+    failures = 0
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://pagination") as client:
+            username = f"paging_{uuid.uuid4().hex[:8]}"
+            password = uuid.uuid4().hex
+            response = await client.post("/api/auth/register", json={
+                "username": username, "email": f"{username}@example.com", "password": password
+            })
+            response.raise_for_status()
+            response = await client.post("/api/auth/login", data={"username": username, "password": password})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            for n in range(args.expenses):
+                # Three expenses per day, so pages split rows that share a date
+                response = await client.post("/api/expenses/", headers=headers, json={
+                    "title": "Pagination check", "category": "Check", "amount": 1,
+                    "date": f"2024-01-{n // 3 + 1:02d}"
+                })
+                response.raise_for_status()
+            # Expenses stored before dates were required: null or no date at all
+            legacy = [{"title": "Legacy", "category": "Check", "amount": 1} for _ in range(args.legacy)]
+            for expense in legacy[::2]:
+                expense["date"] = None
+            if legacy:
+                await get_user_database(username).expenses.insert_many(legacy)
+
+            expected = await walk(client, headers, 1000)
+            total = args.expenses + args.legacy
+            if len(expected) != total:
+                failures += 1
+                print(f"MISMATCH unpaged list: {len(expected)} of {total} expenses")
+            for limit in range(1, args.max_limit + 1):
+                seen = await walk(client, headers, limit)
+                if seen != expected:
+                    failures += 1
+                    print(f"MISMATCH limit {limit}: {len(seen)} rows, {len(set(seen))} distinct, of {len(expected)}")
+    print(f"{args.expenses} dated and {args.legacy} legacy expenses, {failures} mismatches")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cursor pagination visits every expense once, in order")
+    parser.add_argument("--expenses", type=int, default=20)
+    parser.add_argument("--legacy", type=int, default=5, help="expenses stored with a null or missing date")
+    parser.add_argument("--max-limit", type=int, default=8)
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGODB_URL")
+    args = parser.parse_args()
+
+    if args.in_memory:
+        seeding.use_in_memory_database()
+    sys.exit(1 if asyncio.run(run(args)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Query-plan regression check for the expense, category and analytics routes.
+
+Seeds a user into the MongoDB at ``MONGODB_URL``, drives the routers in
+``routers/expenses.py``, ``routers/analytics.py`` and
+``routers/categories.py`` across their parameter combinations, and records
+every ``find``/``aggregate``/``distinct``/``count`` command they send via a
+pymongo ``CommandListener``. Each distinct command is then re-run under
+``explain`` with ``executionStats``, and the check fails if a plan:
+
+- scans a whole collection (``COLLSCAN``),
+- sorts in memory (``SORT``), or
+- examines more than ``--max-ratio`` documents per document it returns.
+
+Run from the backend directory; it exits non-zero on any failure, so it can
+gate CI::
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --storage-mode shared --expenses 5000
+
+mongomock has no query planner, so this needs a real mongod. Use a
+throwaway database server: the seeded ``bench_user_*`` data is left behind.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import httpx  # noqa: E402
+from bson import SON, json_util  # noqa: E402
+from pymongo import monitoring  # noqa: E402
+from . import seed as seeding  # noqa: E402
+
+EXPLAINED_COMMANDS = ("find", "aggregate", "distinct", "count")
+# Session and cluster bookkeeping the driver adds; not part of the query
+DRIVER_FIELDS = ("lsid", "txnNumber", "$db", "$clusterTime", "$readPreference", "readConcern")
+# Plans under these keys were considered and discarded
+SKIPPED_PLAN_KEYS = ("rejectedPlans", "allPlansExecution")
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Keep a copy of every read command sent while recording"""
+
+    def __init__(self):
+        self.recording = False
+        self.commands: List[Tuple[str, SON]] = []
+
+    def started(self, event):
+        if self.recording and event.command_name in EXPLAINED_COMMANDS:
+            command = SON((k, v) for k, v in event.command.items() if k not in DRIVER_FIELDS)
+            self.commands.append((event.database_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+recorder = CommandRecorder()
+
+
+def date_ranges(now: datetime) -> List[Tuple[Optional[str], Optional[str]]]:
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        (None, None),
+        ((today - timedelta(days=30)).date().isoformat(), None),
+        (None, (today - timedelta(days=60)).date().isoformat()),
+        # Whole days only
+        ((today - timedelta(days=90)).isoformat(), (today - timedelta(days=10)).isoformat()),
+        # Partial days at both edges
+        ((today - timedelta(days=45, hours=-9)).isoformat(), (today - timedelta(days=3, hours=-15)).isoformat()),
+        # Inside a single day
+        ((today - timedelta(days=2, hours=-8)).isoformat(), (today - timedelta(days=2, hours=-20)).isoformat()),
+    ]
+
+
+def combinations(ranges, categories=(None, "Food"), sub_categories=(None, "Groceries")):
+    for (start, end), category, sub_category in itertools.product(ranges, categories, sub_categories):
+        params = {"start_date": start, "end_date": end, "category": category, "sub_category": sub_category}
+        yield {k: v for k, v in params.items() if v is not None}
+
+
+async def drive_routes(client: httpx.AsyncClient, headers: dict):
+    """Issue every read the routers can make, across their parameters"""
+    ranges = date_ranges(datetime.utcnow())
+    get = lambda path, **params: client.get(path, headers=headers, params=params)  # noqa: E731
+
+    for params in combinations(ranges):
+        response = await get("/api/expenses/", limit=50, **params)
+        if response.headers.get("X-Next-Cursor"):
+            await get("/api/expenses/", limit=50, cursor=response.headers["X-Next-Cursor"], **params)
+        await get("/api/expenses/export", format="ndjson", **params)
+    expenses = (await get("/api/expenses/", limit=1)).json()
+    if expenses:
+        await get(f"/api/expenses/{expenses[0]['_id']}")
+
+    for params in combinations(ranges[:2]):
+        response = await get("/api/expenses/search", q="Food", limit=20, **params)
+        if response.headers.get("X-Next-Cursor"):
+            await get("/api/expenses/search", q="Food", limit=20, cursor=response.headers["X-Next-Cursor"], **params)
+
+    await get("/api/categories/")
+    await get("/api/categories/subcategories")
+
+    # A unique throwaway parameter keeps the response cache out of the way
+    counter = itertools.count()
+    for params in combinations(ranges):
+        await get("/api/analytics/summary", nocache=next(counter), **params)
+        for grouping in ("day", "week", "month", "year"):
+            await get("/api/analytics/by-date", grouping=grouping, nocache=next(counter), **params)
+            await get("/api/analytics/dashboard", grouping=grouping, nocache=next(counter), **params)
+    for params in combinations(ranges, sub_categories=(None,)):
+        await get("/api/analytics/by-subcategory", nocache=next(counter), **params)
+    for params in combinations(ranges, categories=(None,), sub_categories=(None,)):
+        await get("/api/analytics/by-category", nocache=next(counter), **params)
+
+
+def walk_plan(node, found: List[dict]):
+    """Collect every plan stage of the winning plan, depth first"""
+    if isinstance(node, dict):
+        if "stage" in node:
+            found.append(node)
+        for key, value in node.items():
+            if key not in SKIPPED_PLAN_KEYS:
+                walk_plan(value, found)
+    elif isinstance(node, list):
+        for item in node:
+            walk_plan(item, found)
+
+
+def examined_ratio(explain: dict) -> Tuple[int, int]:
+    """Documents examined, and documents the access path produced.
+
+    For aggregations the stage feeding the pipeline is used rather than the
+    final row count, since a ``$group`` legitimately collapses many
+    documents into a few.
+    """
+    stats = []
+    walk_plan(explain, stats)
+    examined = max((s.get("totalDocsExamined", 0) for s in _execution_stats(explain)), default=0)
+    access = [
+        s for s in stats
+        if s.get("stage") in ("FETCH", "IXSCAN", "COLLSCAN", "IDHACK", "EXPRESS_IXSCAN") and "nReturned" in s
+    ]
+    if access:
+        returned = access[0]["nReturned"]
+    else:
+        returned = max((s.get("nReturned", 0) for s in _execution_stats(explain)), default=0)
+    return examined, returned
+
+
+def _execution_stats(node) -> List[dict]:
+    found = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "executionStats" and isinstance(value, dict):
+                found.append(value)
+            elif key not in SKIPPED_PLAN_KEYS:
+                found.extend(_execution_stats(value))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(_execution_stats(item))
+    return found
+
+
+def is_text_search(command: SON) -> bool:
+    pipeline = command.get("pipeline") or [{}]
+    return "$text" in pipeline[0].get("$match", {})
+
+
+def check_plan(explain: dict, command: SON, max_ratio: float) -> List[str]:
+    problems = []
+    stages = []
+    for key in ("queryPlanner", "stages", "shards"):
+        walk_plan(explain.get(key), stages)
+    names = {stage["stage"] for stage in stages}
+    if "COLLSCAN" in names:
+        problems.append("collection scan")
+    if "SORT" in names and not is_text_search(command):
+        # Ranking by relevance always sorts the matches
+        problems.append("in-memory sort")
+
+    examined, returned = examined_ratio(explain)
+    # Skipped documents are read on purpose
+    allowed = max(returned + command.get("skip", 0), 1) * max_ratio
+    if examined > allowed:
+        problems.append(f"examined {examined} documents to return {returned}")
+    return problems
+
+
+async def explain_commands(client, max_ratio: float) -> List[dict]:
+    seen, report = set(), []
+    for db_name, command in recorder.commands:
+        key = (db_name, json_util.dumps(command, sort_keys=True))
+        if key in seen:
+            continue
+        seen.add(key)
+        explain = await client[db_name].command(SON([("explain", command), ("verbosity", "executionStats")]))
+        report.append({
+            "database": db_name,
+            "command": json.loads(json_util.dumps(command)),
+            "problems": check_plan(explain, command, max_ratio),
+        })
+    return report
+
+
+async def run(args) -> List[dict]:
+    from app import database
+    from app.config import settings
+    from app.main import app
+
+    settings.storage_mode = args.storage_mode
+    settings.rate_limit_enabled = False
+    async with app.router.lifespan_context(app):
+        usernames = await seeding.seed(1, args.expenses, seed=args.seed)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://query-plans") as client:
+            response = await client.post(
+                "/api/auth/login", data={"username": usernames[0], "password": seeding.PASSWORD}
+            )
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            recorder.recording = True
+            await drive_routes(client, headers)
+            recorder.recording = False
+        return await explain_commands(database.client, args.max_ratio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail on query plans that scan, sort in memory or over-read")
+    parser.add_argument("--expenses", type=int, default=3000, help="expenses to seed for the test user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--storage-mode", choices=("database_per_user", "shared"), default="database_per_user")
+    parser.add_argument("--max-ratio", type=float, default=10.0, help="most documents examined per document returned")
+    parser.add_argument("--output", help="also write the full report to this JSON file")
+    args = parser.parse_args()
+
+    monitoring.register(recorder)
+    report = asyncio.run(run(args))
+    failures = [entry for entry in report if entry["problems"]]
+    for entry in failures:
+        print(f"FAIL {entry['database']}: {json.dumps(entry['command'])}")
+        for problem in entry["problems"]:
+            print(f"     - {problem}")
+    print(f"{len(report)} distinct queries explained, {len(failures)} failing")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Latency and throughput benchmarks for the API, driven in-process.
+
+The app runs inside this process behind httpx's ASGI transport, so the
+numbers cover routing, auth, validation, the database and serialization,
+but not the network or uvicorn. Run from the backend directory::
+
+    # against the configured MONGODB_URL, seeding first
+    python -m benchmarks.run --seed-users 5 --seed-expenses 5000
+
+    # against mongomock-motor's in-memory stand-in (relative numbers only)
+    python -m benchmarks.run --in-memory --seed-users 2 --seed-expenses 1000
+
+    # compare two runs
+    python -m benchmarks.compare baseline.json benchmark-results.json
+
+Each scenario issues ``--requests`` requests over ``--concurrency``
+workers, spread across the seeded users, and reports p50/p95/p99 latency
+and throughput. Analytics requests carry a unique throwaway query
+parameter so the response cache doesn't answer them, unless
+``--analytics-cache`` is given.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import httpx  # noqa: E402
+from . import seed as seeding  # noqa: E402
+
+Scenario = Callable[[httpx.AsyncClient, "Context", int], Awaitable[httpx.Response]]
+
+
+class Context:
+    """Per-run state shared by the scenarios"""
+
+    def __init__(self, usernames: List[str], analytics_cache: bool):
+        self.usernames = usernames
+        self.analytics_cache = analytics_cache
+        self.headers: Dict[str, dict] = {}
+        self.cursors: Dict[str, str] = {}
+        self.run_id = datetime.utcnow().strftime("%H%M%S")
+        self.sequence = itertools.count()
+
+    def user(self, i: int) -> str:
+        return self.usernames[i % len(self.usernames)]
+
+    def auth(self, i: int) -> dict:
+        return self.headers[self.user(i)]
+
+    def analytics_params(self, i: int, **params) -> dict:
+        if not self.analytics_cache:
+            params["nocache"] = i
+        return params
+
+
+async def login(client: httpx.AsyncClient, username: str) -> httpx.Response:
+    return await client.post(
+        "/api/auth/login", data={"username": username, "password": seeding.PASSWORD}
+    )
+
+
+async def scenario_login(client, ctx: Context, i: int):
+    return await login(client, ctx.user(i))
+
+
+async def scenario_create(client, ctx: Context, i: int):
+    return await client.post("/api/expenses/", headers=ctx.auth(i), json={
+        "title": "Benchmark expense",
+        "category": "Food",
+        "sub_category": "Groceries",
+        "amount": 12.34,
+    })
+
+
+async def scenario_create_new_category(client, ctx: Context, i: int):
+    # Every request names a category and subcategory the user doesn't have yet
+    n = next(ctx.sequence)
+    return await client.post("/api/expenses/", headers=ctx.auth(i), json={
+        "title": "Benchmark expense",
+        "category": f"Bench {ctx.run_id} {n}",
+        "sub_category": f"Bench sub {ctx.run_id} {n}",
+        "amount": 56.78,
+    })
+
+
+async def scenario_list(client, ctx: Context, i: int):
+    return await client.get("/api/expenses/", headers=ctx.auth(i), params={"limit": 100})
+
+
+async def scenario_paginate(client, ctx: Context, i: int):
+    # Walk each user's history one page at a time, starting over at the end
+    username = ctx.user(i)
+    params = {"limit": 100}
+    if username in ctx.cursors:
+        params["cursor"] = ctx.cursors.pop(username)
+    response = await client.get("/api/expenses/", headers=ctx.auth(i), params=params)
+    if response.headers.get("X-Next-Cursor"):
+        ctx.cursors[username] = response.headers["X-Next-Cursor"]
+    return response
+
+
+def analytics_scenario(path: str, **params) -> Scenario:
+    async def scenario(client, ctx: Context, i: int):
+        return await client.get(path, headers=ctx.auth(i), params=ctx.analytics_params(i, **params))
+    return scenario
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "login": scenario_login,
+    "create_expense": scenario_create,
+    "create_expense_new_category": scenario_create_new_category,
+    "list_expenses": scenario_list,
+    "paginate_expenses": scenario_paginate,
+    "analytics_summary": analytics_scenario("/api/analytics/summary"),
+    "analytics_by_category": analytics_scenario("/api/analytics/by-category"),
+    "analytics_by_subcategory": analytics_scenario("/api/analytics/by-subcategory"),
+    "analytics_by_date_day": analytics_scenario("/api/analytics/by-date", grouping="day"),
+    "analytics_by_date_week": analytics_scenario("/api/analytics/by-date", grouping="week"),
+    "analytics_by_date_month": analytics_scenario("/api/analytics/by-date", grouping="month"),
+    "analytics_by_date_year": analytics_scenario("/api/analytics/by-date", grouping="year"),
+    "analytics_dashboard": analytics_scenario("/api/analytics/dashboard", grouping="month"),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+async def run_scenario(client, ctx: Context, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request, errors
+        while next_request < requests:
+            i = next_request
+            next_request += 1
+            start = time.perf_counter()
+            response = await scenario(client, ctx, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    from app.config import settings
+    from app.main import app
+
+    # A handful of users would otherwise be throttled within the first scenario
+    settings.rate_limit_enabled = args.rate_limits
+    results = {}
+    async with app.router.lifespan_context(app):
+        if args.seed_users:
+            usernames = await seeding.seed(args.seed_users, args.seed_expenses, seed=args.seed)
+        else:
+            usernames = [seeding.username_for(n) for n in range(args.users)]
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            ctx = Context(usernames, args.analytics_cache)
+            for username in usernames:
+                response = await login(client, username)
+                response.raise_for_status()
+                ctx.headers[username] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            for name in args.scenarios or SCENARIOS:
+                scenario = SCENARIOS[name]
+                # A few unmeasured requests warm caches and connections
+                await run_scenario(client, ctx, scenario, min(args.warmup, args.requests), args.concurrency)
+                results[name] = await run_scenario(client, ctx, scenario, args.requests, args.concurrency)
+                print(
+                    f"{name:<30} p50 {results[name]['p50_ms']:>9.2f} ms  "
+                    f"p95 {results[name]['p95_ms']:>9.2f} ms  p99 {results[name]['p99_ms']:>9.2f} ms  "
+                    f"{results[name]['throughput_rps']:>8.1f} req/s  errors {results[name]['errors']}"
+                )
+
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "database": "in-memory" if args.in_memory else "mongodb",
+        "config": {
+            "users": len(usernames),
+            "seed_expenses": args.seed_expenses if args.seed_users else None,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "analytics_cache": args.analytics_cache,
+            "rate_limits": args.rate_limits,
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGODB_URL")
+    parser.add_argument("--seed-users", type=int, default=0, help="seed this many users before running")
+    parser.add_argument("--seed-expenses", type=int, default=2000, help="expenses per seeded user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=10, help="already seeded users to use without --seed-users")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--analytics-cache", action="store_true", help="let the response cache answer analytics")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the per-user rate limits on")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    if args.in_memory:
+        if not args.seed_users:
+            parser.error("--in-memory starts empty; pass --seed-users")
+        seeding.use_in_memory_database()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Seed users and expenses for benchmarking.
+
+Run from the backend directory against the configured ``MONGODB_URL``::
+
+    python -m benchmarks.seed --users 10 --expenses 5000
+
+Every user is called ``bench_user_{n}`` with the password ``bench-password``.
+Expenses are written straight to the database through the repository
+layer rather than the HTTP API, with one shared password hash, and each
+user's known names and rollups are built as the API would. Seeding again
+adds another batch of expenses to the same users.
+"""
+import argparse
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from app import database  # noqa: E402
+from app.auth import pwd_context  # noqa: E402
+from app.known_names import ensure_names  # noqa: E402
+from app.models import Principal  # noqa: E402
+from app.repository import get_user_store  # noqa: E402
+from app.rollups import rebuild_rollups  # noqa: E402
+
+PASSWORD = "bench-password"
+
+# category -> (relative frequency, typical amount, subcategories)
+CATEGORIES = {
+    "Food": (30, 18.0, ["Groceries", "Restaurants", "Coffee", "Takeaway"]),
+    "Transport": (18, 12.0, ["Fuel", "Public Transit", "Taxi", "Parking"]),
+    "Housing": (5, 600.0, ["Rent", "Utilities", "Maintenance"]),
+    "Shopping": (14, 45.0, ["Clothes", "Electronics", "Household"]),
+    "Entertainment": (10, 25.0, ["Movies", "Games", "Concerts", "Subscriptions"]),
+    "Health": (6, 40.0, ["Pharmacy", "Doctor", "Gym"]),
+    "Travel": (3, 250.0, ["Flights", "Hotels", "Activities"]),
+    "Bills": (8, 70.0, ["Phone", "Internet", "Insurance"]),
+    "Education": (2, 80.0, ["Books", "Courses"]),
+    "Gifts": (4, 35.0, ["Family", "Friends", None]),
+}
+
+
+def username_for(n: int) -> str:
+    return f"bench_user_{n}"
+
+
+def make_expenses(rng: random.Random, count: int, days: int, now: datetime) -> List[dict]:
+    names = list(CATEGORIES)
+    weights = [CATEGORIES[name][0] for name in names]
+    expenses = []
+    for _ in range(count):
+        category = rng.choices(names, weights)[0]
+        _, typical, subcategories = CATEGORIES[category]
+        # Skewed towards recent days, as real histories are
+        day = min(int(rng.expovariate(3.0 / days)), days - 1)
+        date = (now - timedelta(days=day)).replace(
+            hour=rng.randint(7, 22), minute=rng.randint(0, 59), second=0, microsecond=0
+        )
+        expenses.append({
+            "title": f"{category} expense",
+            "category": category,
+            "sub_category": rng.choice(subcategories),
+            "amount": round(rng.lognormvariate(0, 0.6) * typical, 2),
+            "date": date,
+            "comments": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+    return expenses
+
+
+async def seed_user(n: int, expenses: int, days: int, hashed_password: str, rng: random.Random) -> Principal:
+    username = username_for(n)
+    users = database.get_database().users
+    await users.update_one(
+        {"username": username},
+        {"$setOnInsert": {
+            "username": username,
+            "email": f"{username}@example.com",
+            "hashed_password": hashed_password,
+        }},
+        upsert=True
+    )
+    user = await users.find_one({"username": username})
+    principal = Principal(id=str(user["_id"]), username=username)
+    user_db = get_user_store(principal)
+
+    now = datetime.utcnow()
+    for start in range(0, expenses, 1000):
+        batch = make_expenses(rng, min(1000, expenses - start), days, now)
+        await ensure_names(
+            user_db, username,
+            categories={e["category"] for e in batch},
+            subcategories={e["sub_category"] for e in batch}
+        )
+        await user_db.expenses.insert_many(batch, ordered=False)
+    await rebuild_rollups(user_db, username)
+    return principal
+
+
+async def seed(users: int, expenses: int, days: int = 365, seed: int = 42) -> List[str]:
+    """Seed ``users`` users with ``expenses`` expenses each; returns the usernames"""
+    rng = random.Random(seed)
+    hashed_password = pwd_context.hash(PASSWORD)
+    usernames = []
+    for n in range(users):
+        principal = await seed_user(n, expenses, days, hashed_password, rng)
+        usernames.append(principal.username)
+    return usernames
+
+
+def use_in_memory_database():
+    """Swap the Motor client for mongomock-motor's in-memory stand-in"""
+    try:
+        import mongomock_motor
+    except ImportError:
+        raise SystemExit("--in-memory needs mongomock-motor: pip install -r benchmarks/requirements.txt")
+    database.AsyncIOMotorClient = lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient()
+
+
+async def main(args):
+    await database.connect_db()
+    try:
+        usernames = await seed(args.users, args.expenses, args.days, args.seed)
+        print(f"Seeded {len(usernames)} users with {args.expenses} expenses each")
+    finally:
+        await database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed benchmark users and expenses")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=5000, help="expenses per user")
+    parser.add_argument("--days", type=int, default=365, help="spread expenses over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
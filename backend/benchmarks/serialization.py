@@ -0,0 +1,85 @@
+"""Serialization cost of a 1000-row expense page, before and after orjson.
+
+Run from the backend directory::
+
+    python -m benchmarks.serialization [--rows 1000] [--repeat 200]
+
+"before" is the old path: stringify each ``_id`` in Python, validate
+against ``response_model=List[dict]``, run ``jsonable_encoder`` and encode
+with the standard library. "after" hands the raw documents to
+``FastJSONResponse``.
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+from bson import ObjectId
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from app.serialization import FastJSONResponse  # noqa: E402
+
+
+def make_page(rows: int) -> List[dict]:
+    now = datetime(2024, 1, 1, 12, 30)
+    return [
+        {
+            "_id": ObjectId(),
+            "title": f"Expense {i}",
+            "category": "Food",
+            "sub_category": "Groceries",
+            "amount": 12.5 + i,
+            "date": now - timedelta(hours=i),
+            "comments": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(rows)
+    ]
+
+
+page_adapter = TypeAdapter(List[dict])
+
+
+def before(page: List[dict]) -> bytes:
+    for expense in page:
+        expense["_id"] = str(expense["_id"])
+    content = jsonable_encoder(page_adapter.validate_python(page))
+    return JSONResponse(content).body
+
+
+def after(page: List[dict]) -> bytes:
+    return FastJSONResponse(page).body
+
+
+def measure(encode, rows: int, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        page = make_page(rows)
+        start = time.perf_counter()
+        encode(page)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare expense page serialization paths")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for name, encode in (("before", before), ("after", after)):
+        timings = measure(encode, args.rows, args.repeat)
+        print(
+            f"{name:>6}: median {statistics.median(timings) * 1000:.2f} ms, "
+            f"min {min(timings) * 1000:.2f} ms per {args.rows}-row page"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+// Write .br and .gz next to every compressible file in dist/, so the backend
+// can serve them as-is instead of compressing on each request.
+import { readdirSync, readFileSync, statSync, writeFileSync } from 'node:fs';
+import { extname, join } from 'node:path';
+import { brotliCompressSync, constants, gzipSync } from 'node:zlib';
+
+const DIST = new URL('../dist/', import.meta.url).pathname;
+const EXTENSIONS = new Set(['.js', '.css', '.html', '.svg', '.json', '.txt', '.ico', '.webmanifest']);
+const MIN_SIZE = 1024;
+
+function* files(dir) {
+    for (const name of readdirSync(dir)) {
+        const path = join(dir, name);
+        if (statSync(path).isDirectory()) {
+            yield* files(path);
+        } else {
+            yield path;
+        }
+    }
+}
+
+let written = 0;
+for (const path of files(DIST)) {
+    if (!EXTENSIONS.has(extname(path))) continue;
+    const source = readFileSync(path);
+    if (source.length < MIN_SIZE) continue;
+
+    const variants = {
+        '.br': brotliCompressSync(source, {
+            params: {
+                [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+                [constants.BROTLI_PARAM_SIZE_HINT]: source.length,
+            },
+        }),
+        '.gz': gzipSync(source, { level: 9 }),
+    };
+    for (const [suffix, compressed] of Object.entries(variants)) {
+        // Not worth a variant if it barely shrinks
+        if (compressed.length < source.length * 0.9) {
+            writeFileSync(path + suffix, compressed);
+            written++;
+        }
+    }
+}
+console.log(`precompress: wrote ${written} files`);
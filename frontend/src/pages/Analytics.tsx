@@ -55,15 +55,18 @@ const Analytics: React.FC = () => {
                 end_date: filters.end_date || undefined,
             };
 
-            const [summaryData, categoryAnalytics, dateAnalytics] = await Promise.all([
-                analyticsService.getSummary(params),
-                analyticsService.getByCategory(params),
-                analyticsService.getByDate({ ...params, grouping: filters.grouping }),
-            ]);
-
-            setSummary(summaryData);
-            setCategoryData(categoryAnalytics);
-            setDateData(dateAnalytics);
+            const dashboard = await analyticsService.getDashboard({
+                ...params,
+                grouping: filters.grouping,
+                // Expenses with a time of day bucket by the browser's local days (plain
+                // dates stay on their calendar day), with empty periods as zero
+                tz: Intl.DateTimeFormat().resolvedOptions().timeZone,
+                fill: true,
+            });
+
+            setSummary(dashboard.summary);
+            setCategoryData(dashboard.by_category);
+            setDateData(dashboard.by_date);
         } catch (error) {
             console.error('Failed to load analytics:', error);
         } finally {
@@ -1,5 +1,5 @@
 import api from '../utils/api';
-import { ExpenseSummary, CategoryAnalytics, SubCategoryAnalytics, DateAnalytics } from '../types';
+import { ExpenseSummary, CategoryAnalytics, SubCategoryAnalytics, DateAnalytics, DashboardAnalytics } from '../types';
 
 export const analyticsService = {
     async getSummary(params?: {
@@ -35,8 +35,25 @@ export const analyticsService = {
         sub_category?: string;
         start_date?: string;
         end_date?: string;
+        tz?: string;
+        fill?: boolean;
+        rolling?: number;
     }): Promise<DateAnalytics[]> {
         const response = await api.get<DateAnalytics[]>('/analytics/by-date', { params });
         return response.data;
     },
+
+    async getDashboard(params?: {
+        grouping?: 'day' | 'week' | 'month' | 'year';
+        category?: string;
+        sub_category?: string;
+        start_date?: string;
+        end_date?: string;
+        tz?: string;
+        fill?: boolean;
+        rolling?: number;
+    }): Promise<DashboardAnalytics> {
+        const response = await api.get<DashboardAnalytics>('/analytics/dashboard', { params });
+        return response.data;
+    },
 };
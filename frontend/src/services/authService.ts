@@ -22,6 +22,11 @@ export const authService = {
     },
 
     logout() {
+        const token = localStorage.getItem('token');
+        if (token) {
+            // Revoke the token server-side; the local session ends either way
+            api.post('/auth/logout', null, { headers: { Authorization: `Bearer ${token}` } }).catch(() => {});
+        }
         localStorage.removeItem('token');
     },
 };
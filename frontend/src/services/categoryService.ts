@@ -12,12 +12,12 @@ export const categoryService = {
         return response.data;
     },
 
-    async updateCategory(id: string, name: string): Promise<{ message: string }> {
+    async updateCategory(id: string, name: string): Promise<{ message: string; job_id: string | null }> {
         const response = await api.put(`/categories/${id}`, { name });
         return response.data;
     },
 
-    async deleteCategory(id: string): Promise<{ message: string }> {
+    async deleteCategory(id: string): Promise<{ message: string; job_id: string | null }> {
         const response = await api.delete(`/categories/${id}`);
         return response.data;
     },
@@ -32,12 +32,12 @@ export const categoryService = {
         return response.data;
     },
 
-    async updateSubCategory(id: string, name: string, category_id?: string): Promise<{ message: string }> {
+    async updateSubCategory(id: string, name: string, category_id?: string): Promise<{ message: string; job_id: string | null }> {
         const response = await api.put(`/categories/subcategories/${id}`, { name, category_id });
         return response.data;
     },
 
-    async deleteSubCategory(id: string): Promise<{ message: string }> {
+    async deleteSubCategory(id: string): Promise<{ message: string; job_id: string | null }> {
         const response = await api.delete(`/categories/subcategories/${id}`);
         return response.data;
     },
@@ -80,4 +80,13 @@ export interface DateAnalytics {
     total_amount: number;
     count: number;
     avg_amount: number;
+    rolling_total?: number;
+    rolling_avg?: number;
+}
+
+export interface DashboardAnalytics {
+    summary: ExpenseSummary;
+    by_category: CategoryAnalytics[];
+    by_subcategory: SubCategoryAnalytics[];
+    by_date: DateAnalytics[];
 }